@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Instagram Ultimate Bot - Batch Downloader
+
+Downloads a list of Instagram URLs (one per line, from a file or stdin) into
+a directory with UnifiedExtractor, without going through Telegram. Every
+finished URL is appended to a JSONL manifest in the output directory, so an
+interrupted run can be restarted and skips what is already done.
+
+    python batch.py urls.txt -o archive/ -j 8
+    cat urls.txt | python batch.py - -o archive/
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Set
+
+# Add project to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.extractors.unified import UnifiedExtractor, shutdown_executor
+from core.urls import shortcode_from_url
+import config
+
+logger = logging.getLogger('batch')
+
+MANIFEST = 'manifest.jsonl'
+
+class BatchDownloader:
+    """Streams URLs through UnifiedExtractor into an output directory"""
+    
+    def __init__(self, output_dir: Path, concurrency: int, retry_failed: bool = True):
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.retry_failed = retry_failed
+        self.extractor = UnifiedExtractor()
+        self.manifest_path = output_dir / MANIFEST
+        self.done: Set[str] = set()
+        self.stats = {'ok': 0, 'failed': 0, 'skipped': 0, 'bytes': 0}
+        self._manifest = None
+    
+    @staticmethod
+    def key(url: str) -> str:
+        """Identity of a post in the manifest"""
+        return shortcode_from_url(url) or url
+    
+    def load_manifest(self):
+        """Remember what earlier runs already finished"""
+        if not self.manifest_path.exists():
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of an interrupted run
+                if entry.get('status') == 'ok' or not self.retry_failed:
+                    self.done.add(entry['key'])
+        logger.info(f"Resuming: {len(self.done)} URLs already in {self.manifest_path}")
+    
+    def record(self, entry: Dict):
+        entry['at'] = datetime.now().isoformat(timespec='seconds')
+        self._manifest.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._manifest.flush()
+    
+    async def urls(self, source):
+        """Yield URLs one line at a time - the list is never held in memory"""
+        while True:
+            line = await asyncio.to_thread(source.readline)
+            if not line:
+                return
+            url = line.strip()
+            if url and not url.startswith('#'):
+                yield url
+    
+    async def run(self, source):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.load_manifest()
+        self._manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.ensure_future(self._worker(queue)) for _ in range(self.concurrency)]
+        started = time.perf_counter()
+        try:
+            seen = set()
+            async for url in self.urls(source):
+                key = self.key(url)
+                if key in self.done or key in seen:
+                    self.stats['skipped'] += 1
+                    continue
+                seen.add(key)
+                await queue.put(url)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await self.extractor.close()
+            self._manifest.close()
+        self.summary(time.perf_counter() - started)
+    
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            url = await queue.get()
+            if url is None:
+                return
+            await self.download(url)
+    
+    async def download(self, url: str):
+        key = self.key(url)
+        result = None
+        try:
+            result = await self.extractor.extract(url)
+            media = await self.extractor.process(result)
+            files = self.store(key, media)
+        except Exception as e:
+            self.stats['failed'] += 1
+            self.record({'key': key, 'url': url, 'status': 'failed', 'error': str(e)[:300]})
+            logger.warning(f"Failed {url}: {e}")
+            return
+        finally:
+            if result:
+                self.extractor.cleanup(result)
+        
+        self.stats['ok'] += 1
+        self.stats['bytes'] += media['size']
+        self.record({
+            'key': key,
+            'url': url,
+            'status': 'ok',
+            'files': files,
+            'bytes': media['size'],
+            'author': media['metadata']['author'],
+            'caption': media['caption']
+        })
+        done = self.stats['ok'] + self.stats['failed']
+        logger.info(f"[{done}] {key}: {len(files)} file(s), {media['size'] / (1024 * 1024):.1f} MB")
+    
+    def store(self, key: str, media: Dict) -> list:
+        """Move downloaded files out of the workspace into the output directory"""
+        items = media['items'] if media['type'] == 'album' else [media]
+        name = re.sub(r'[^\w-]+', '_', key)[:100]
+        files = []
+        for i, item in enumerate(items):
+            ext = os.path.splitext(item['path'])[1]
+            filename = f'{name}_{i + 1:02d}{ext}' if len(items) > 1 else f'{name}{ext}'
+            shutil.move(item['path'], self.output_dir / filename)
+            files.append(filename)
+        return files
+    
+    def summary(self, elapsed: float):
+        done = self.stats['ok'] + self.stats['failed']
+        mb = self.stats['bytes'] / (1024 * 1024)
+        print(
+            f"\nDone in {elapsed:.1f}s: {self.stats['ok']} downloaded, {self.stats['failed']} failed, "
+            f"{self.stats['skipped']} skipped\n"
+            f"Throughput: {done / elapsed if elapsed else 0:.2f} URLs/s, {mb / elapsed if elapsed else 0:.2f} MB/s "
+            f"({mb:.1f} MB total)\n"
+            f"Manifest: {self.manifest_path}"
+        )
+
+def main(args: argparse.Namespace):
+    config.ensure_dirs()
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    downloader = BatchDownloader(Path(args.output), args.concurrency, retry_failed=not args.skip_failed)
+    try:
+        asyncio.run(downloader.run(source))
+    except KeyboardInterrupt:
+        print("\nInterrupted - run the same command again to resume")
+    finally:
+        shutdown_executor()
+        if source is not sys.stdin:
+            source.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download a list of Instagram URLs")
+    parser.add_argument('input', help="file with one URL per line, or - for stdin")
+    parser.add_argument('-o', '--output', default='downloads', help="output directory (default: downloads)")
+    parser.add_argument('-j', '--concurrency', type=int, default=config.DOWNLOAD_WORKERS,
+                        help=f"URLs downloaded at once (default: {config.DOWNLOAD_WORKERS})")
+    parser.add_argument('--skip-failed', action='store_true',
+                        help="don't retry URLs that failed in an earlier run")
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)s | %(name)s | %(message)s'
+    )
+    main(args)
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the download pipeline
+
+Serves Instagram-like post pages and the repo's sample video from a local
+stub server, answers Bot API calls with a fake Telegram transport, and drives
+UltimateInstagramBot.handle_link (or UnifiedExtractor on its own) at several
+concurrency levels. Nothing leaves the machine.
+
+    python benchmarks/pipeline.py --concurrency 1,4,16 --requests 32
+    python benchmarks/pipeline.py --target extractor --strategies ytdlp --items 3
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).parent.parent
+
+# Isolate the run before config is imported: its own scratch directory
+# (so disk usage is measurable) and no file_id cache (every request downloads)
+os.environ['WORKSPACE_DIR'] = tempfile.mkdtemp(prefix='bench-')
+os.environ['FILE_ID_CACHE_BACKEND'] = 'none'
+os.chdir(ROOT)
+
+# Add project to path
+sys.path.insert(0, str(ROOT))
+
+import psutil
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.request import BaseRequest, RequestData
+
+import config
+from core.urls import InstagramLink
+
+PAGE = """<html><head><title>{title}</title>
+<meta property="og:title" content="{title}">
+</head><body>{videos}</body></html>"""
+
+class StubInstagram:
+    """Local stand-in for Instagram pages and its media CDN"""
+    
+    def __init__(self, media_file: Path, items: int = 1):
+        self.media_file = media_file
+        self.items = items
+        self.base_url = None
+        self._runner = None
+    
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/p/{shortcode}/', self.post_page)
+        app.router.add_get('/media/{name}', self.media)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+    
+    async def post_page(self, request: web.Request) -> web.Response:
+        shortcode = request.match_info['shortcode']
+        items = int(request.query.get('items', self.items))
+        videos = ''.join(
+            f'<video src="{self.base_url}/media/{shortcode}-{i}.mp4"></video>'
+            for i in range(items)
+        )
+        html = PAGE.format(title=f'Benchmark post {shortcode}', videos=videos)
+        return web.Response(text=html, content_type='text/html')
+    
+    async def media(self, request: web.Request) -> web.FileResponse:
+        # FileResponse answers Range requests, like the real CDN
+        return web.FileResponse(self.media_file, headers={'Content-Type': 'video/mp4'})
+
+class FakeTelegramRequest(BaseRequest):
+    """Bot API transport that answers locally and drains uploaded files"""
+    
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self.deliveries = defaultdict(int)
+        self.uploaded_bytes = 0
+        self._message_id = 0
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+    
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        params = request_data.parameters if request_data else {}
+        if request_data and request_data.contains_files:
+            for _, content, _ in request_data.multipart_data.values():
+                self.uploaded_bytes += await asyncio.to_thread(self._drain, content)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self._result(api_method, params)
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+    
+    @staticmethod
+    def _drain(content) -> int:
+        if isinstance(content, bytes):
+            return len(content)
+        total = 0
+        while True:
+            chunk = content.read(64 * 1024)
+            if not chunk:
+                return total
+            total += len(chunk)
+    
+    def _message(self, chat_id, **extra) -> Dict:
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            **extra
+        }
+    
+    def _media(self, kind: str) -> Dict:
+        file_id = f'bench-{kind}-{self._message_id}'
+        if kind == 'video':
+            return {'video': {
+                'file_id': file_id, 'file_unique_id': file_id,
+                'width': 720, 'height': 1280, 'duration': 10
+            }}
+        return {'photo': [{
+            'file_id': file_id, 'file_unique_id': file_id, 'width': 1080, 'height': 1080
+        }]}
+    
+    def _result(self, api_method: str, params: Dict):
+        if api_method == 'getMe':
+            return {
+                'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                'can_join_groups': False, 'can_read_all_group_messages': False,
+                'supports_inline_queries': False
+            }
+        chat_id = params.get('chat_id', 0)
+        if api_method in ('sendVideo', 'sendPhoto'):
+            self.deliveries[int(chat_id)] += 1
+            return self._message(chat_id, **self._media('video' if api_method == 'sendVideo' else 'photo'))
+        if api_method == 'sendMediaGroup':
+            self.deliveries[int(chat_id)] += 1
+            return [self._message(chat_id, **self._media(item['type'])) for item in params['media']]
+        if api_method in ('sendMessage', 'editMessageText'):
+            return self._message(chat_id, text=params.get('text', ''))
+        return True
+
+class ResourceSampler:
+    """Peak RSS (bot plus worker processes) and scratch disk usage"""
+    
+    def __init__(self, workspace_dir: str, interval: float = 0.05):
+        self.workspace_dir = workspace_dir
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._task = None
+    
+    def _sample(self):
+        rss = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            with contextlib.suppress(psutil.Error):
+                rss += child.memory_info().rss
+        disk = 0
+        for dirpath, _, filenames in os.walk(self.workspace_dir):
+            for name in filenames:
+                with contextlib.suppress(OSError):
+                    disk += os.path.getsize(os.path.join(dirpath, name))
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_disk = max(self.peak_disk, disk)
+    
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self._sample)
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        self.peak_rss = self.peak_disk = 0
+        self._task = asyncio.ensure_future(self._run())
+    
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        await asyncio.to_thread(self._sample)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+class PipelineBenchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.stub = StubInstagram(Path(args.media), args.items)
+        self.transport = FakeTelegramRequest(args.telegram_latency)
+        self.sampler = ResourceSampler(os.environ['WORKSPACE_DIR'])
+        self.telegram = None
+        self.bot = None
+        self.extractor = None
+        self._request_id = 0
+    
+    async def setup(self):
+        from bot import UltimateInstagramBot
+        
+        config.ensure_dirs()
+        await self.stub.start()
+        self.telegram = Bot('123456:BENCH', request=self.transport, get_updates_request=FakeTelegramRequest())
+        await self.telegram.initialize()
+        self.bot = UltimateInstagramBot()
+        self.extractor = self.bot.extractor
+        if self.args.strategies:
+            names = self.args.strategies.split(',')
+            self.extractor.strategies = {name: self.extractor.strategies[name] for name in names}
+    
+    async def teardown(self):
+        await self.bot.shutdown(None)
+        await self.telegram.shutdown()
+        await self.stub.stop()
+    
+    def next_url(self) -> str:
+        self._request_id += 1
+        shortcode = 'BENCH' if self.args.same_url else f'B{self._request_id:07d}'
+        return f'{self.stub.base_url}/p/{shortcode}/'
+    
+    async def via_bot(self, url: str) -> bool:
+        """One chat message through the bot, as Telegram would deliver it
+        
+        handle_url would ignore the stub's 127.0.0.1 links, so the message
+        skips link parsing and goes straight to handle_link.
+        """
+        chat_id = 10 ** 6 + self._request_id
+        user_id = 1000 + self._request_id % self.args.users
+        update = Update.de_json({
+            'update_id': self._request_id,
+            'message': {
+                'message_id': self._request_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+                'text': url
+            }
+        }, self.telegram)
+        before = self.transport.deliveries[chat_id]
+        await self.bot.handle_link(update, InstagramLink('post', url, None))
+        return self.transport.deliveries[chat_id] > before
+    
+    async def via_extractor(self, url: str) -> bool:
+        """Extraction and processing only, no Telegram round trips"""
+        result = await self.extractor.extract(url)
+        try:
+            if not result['success']:
+                return False
+            await self.extractor.process(result)
+            return True
+        finally:
+            self.extractor.cleanup(result)
+    
+    async def run_level(self, concurrency: int, requests: int) -> Dict:
+        drive = self.via_bot if self.args.target == 'bot' else self.via_extractor
+        limit = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+        outcomes = defaultdict(int)
+        
+        async def one():
+            async with limit:
+                url = self.next_url()
+                started = time.perf_counter()
+                try:
+                    ok = await drive(url)
+                except Exception:
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                outcomes['ok' if ok else 'failed'] += 1
+        
+        uploaded = self.transport.uploaded_bytes
+        api_calls = sum(self.transport.calls.values())
+        self.sampler.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        await self.sampler.stop()
+        
+        return {
+            'concurrency': concurrency,
+            'requests': requests,
+            'ok': outcomes['ok'],
+            'failed': outcomes['failed'],
+            'seconds': elapsed,
+            'throughput': requests / elapsed,
+            'uploaded_mb_s': (self.transport.uploaded_bytes - uploaded) / elapsed / (1024 * 1024),
+            'api_calls_per_request': (sum(self.transport.calls.values()) - api_calls) / requests,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'peak_rss_mb': self.sampler.peak_rss / (1024 * 1024),
+            'peak_disk_mb': self.sampler.peak_disk / (1024 * 1024)
+        }
+
+def print_report(rows: List[Dict], args: argparse.Namespace):
+    print(f"\ntarget={args.target} strategies={args.strategies or 'all'} items={args.items} "
+          f"executor={config.DOWNLOAD_EXECUTOR} workers={config.DOWNLOAD_WORKERS}")
+    header = ('conc', 'reqs', 'ok', 'fail', 'req/s', 'up MB/s', 'calls/rq', 'p50 ms', 'p95 ms', 'p99 ms', 'RSS MB',
+              'disk MB')
+    print(''.join(f'{h:>9}' for h in header))
+    for row in rows:
+        print(
+            f"{row['concurrency']:>9}{row['requests']:>9}{row['ok']:>9}{row['failed']:>9}"
+            f"{row['throughput']:>9.2f}{row['uploaded_mb_s']:>9.1f}{row['api_calls_per_request']:>9.1f}"
+            f"{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{row['p99_ms']:>9.0f}"
+            f"{row['peak_rss_mb']:>9.0f}{row['peak_disk_mb']:>9.1f}"
+        )
+
+def default_media() -> str:
+    samples = sorted(ROOT.glob('*.mp4'))
+    return str(samples[0]) if samples else ''
+
+async def main(args: argparse.Namespace):
+    benchmark = PipelineBenchmark(args)
+    # The pipeline prints and logs every request; keep the report readable
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    rows = []
+    await benchmark.setup()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    try:
+        with quiet:
+            if args.warmup:
+                await benchmark.run_level(1, args.warmup)
+            for concurrency in args.concurrency:
+                rows.append(await benchmark.run_level(concurrency, args.requests or concurrency * 4))
+    finally:
+        with quiet:
+            await benchmark.teardown()
+        shutil.rmtree(os.environ['WORKSPACE_DIR'], ignore_errors=True)
+    
+    print_report(rows, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': rows}, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline download pipeline benchmark')
+    parser.add_argument('--target', choices=('bot', 'extractor'), default='bot',
+                        help='drive handle_link end to end, or only UnifiedExtractor')
+    parser.add_argument('--concurrency', type=lambda s: [int(c) for c in s.split(',')], default=[1, 4, 16],
+                        help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=0, help='requests per level (default 4x concurrency)')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--strategies', default='', help="comma-separated strategy order, e.g. 'ytdlp'")
+    parser.add_argument('--items', type=int, default=1, help='videos per post (>1 makes carousels)')
+    parser.add_argument('--users', type=int, default=1000, help='distinct users the requests come from')
+    parser.add_argument('--same-url', action='store_true', help='request one post repeatedly (coalescing)')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='seconds added to each Bot API call')
+    parser.add_argument('--media', default=default_media(), help='video file served by the stub CDN')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    if not args.media:
+        parser.error('no sample .mp4 found - pass --media')
+    
+    asyncio.run(main(args))
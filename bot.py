@@ -6,60 +6,130 @@ Instagram Ultimate Bot - Main Entry Point
 # Fix Windows encoding first
 import fix_encoding
 
+import time
+_STARTED = time.perf_counter()  # cold start is measured from here
+
 import asyncio
 import logging
 import sys
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import os
+from contextlib import ExitStack
 from datetime import datetime
 
 # Add project to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile,
+    InputMediaPhoto, InputMediaVideo, Message
+)
+from telegram.constants import ChatType
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, 
     filters, ContextTypes, CallbackQueryHandler
 )
-from core.extractors.unified import UnifiedExtractor
+from core.extractors.unified import UnifiedExtractor, shutdown_executor
+from core.cache import create_file_id_cache
+from core.store import create_media_store, store_key
+from core.cookies import COOKIE_POOL
+from core.jobqueue import RemoteExtractor, create_job_queue
+from core.profiles import ProfileSync, create_profile_index
+from core.progress import ProgressReporter
+from core.scheduler import FairScheduler, SchedulerBusy
+from core.metrics import (
+    REGISTRY, STAGE_SECONDS, STARTUP_SECONDS, REQUESTS, UPLOADS_INFLIGHT, UPLOADED_BYTES,
+    CallbackGauge, MetricsServer
+)
+from core.urls import InstagramLink, content_kind, find_links, shortcode_from_url, username_from_text
 import config
 
-# Setup logging - remove emojis for Windows compatibility
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
-    handlers=[
-        logging.FileHandler('logs/bot.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+IMPORT_SECONDS = time.perf_counter() - _STARTED
+
+# Scheduler "user" that profile sync downloads are queued under
+PROFILE_SYNC_USER = 0
+
 logger = logging.getLogger(__name__)
 
+def setup_logging():
+    """Setup logging - remove emojis for Windows compatibility"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
+        handlers=[
+            logging.FileHandler(config.LOGS_DIR / 'bot.log', encoding='utf-8'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
 class UltimateInstagramBot:
     """Main bot class"""
     
     def __init__(self):
         self.token = config.TELEGRAM_BOT_TOKEN
-        self.extractor = UnifiedExtractor()
+        if config.BOT_ROLE == 'frontend':
+            # Downloads run in separate worker processes (worker.py)
+            self.extractor = RemoteExtractor(create_job_queue())
+        else:
+            self.extractor = UnifiedExtractor()
+        self.file_ids = create_file_id_cache()
+        self.media_store = create_media_store()
+        self.scheduler = FairScheduler(
+            workers=config.SCHEDULER_WORKERS,
+            max_queue=config.QUEUE_MAX,
+            user_max_inflight=config.USER_MAX_INFLIGHT,
+            user_max_queued=config.USER_MAX_QUEUED
+        )
+        self.profiles = create_profile_index()
+        self.profile_sync = ProfileSync(self.profiles, self.deliver_post)
+        self.metrics_server = None
+        self.prewarm_task = None
+        self.app = None
+        REGISTRY.register(CallbackGauge(
+            'bot_queue_depth', 'Jobs waiting in the scheduler',
+            lambda: self.scheduler.stats()['queued']
+        ))
+        REGISTRY.register(CallbackGauge(
+            'bot_jobs_running', 'Jobs currently dispatched by the scheduler',
+            lambda: self.scheduler.stats()['running']
+        ))
         self.stats = {
             'users': set(),
             'downloads': 0,
             'bytes_sent': 0,
-            'errors': 0
+            'errors': 0,
+            'cache_hits': 0,
+            'cache_misses': 0
         }
         
     async def initialize(self):
         """Initialize all components"""
         logger.info("Starting Instagram Ultimate Bot...")
         
-        # Create logs directory
-        os.makedirs('logs', exist_ok=True)
-        os.makedirs('temp', exist_ok=True)
-        os.makedirs('cookies', exist_ok=True)
+        config.ensure_dirs()
+        
+        if config.METRICS_PORT:
+            self.metrics_server = MetricsServer(config.METRICS_HOST, config.METRICS_PORT, snapshot=self.snapshot)
+            await self.metrics_server.start()
         
         logger.info("Bot initialization complete")
         
+    def snapshot(self) -> Dict[str, Any]:
+        """Live counters for the terminal dashboard"""
+        return {
+            'downloads': self.stats['downloads'],
+            'users': len(self.stats['users']),
+            'errors': self.stats['errors'],
+            'bytes_sent': self.stats['bytes_sent'],
+            'cache_hits': self.stats['cache_hits'],
+            'cache_misses': self.stats['cache_misses'],
+            'scheduler': self.scheduler.stats(),
+            'strategies': self.extractor.stats,
+            'cookies': COOKIE_POOL.stats(),
+            'media_store': self.media_store.stats() if self.media_store else None
+        }
+        
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
@@ -78,27 +148,113 @@ Features:
 Stats:
 • Users served: {len(self.stats['users'])}
 • Total downloads: {self.stats['downloads']}
+• Requests in queue: {self.scheduler.stats()['queued']}
 
 Just send me any Instagram URL to start!
+Use /follow <username> to get an account's new posts automatically.
         """
         
         await update.message.reply_text(welcome_text)
         
     async def handle_url(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle Instagram URLs"""
-        url = update.message.text
+        """Handle messages with Instagram links; each link is downloaded separately"""
+        links = find_links(update.message.text, limit=config.MAX_LINKS_PER_MESSAGE)
+        if not links:
+            # Chat noise costs a regex, not an extraction; groups aren't answered at all
+            if update.effective_chat.type == ChatType.PRIVATE:
+                await update.message.reply_text(
+                    "Send me a link to an Instagram post, reel or story."
+                )
+            return
+        await asyncio.gather(*(self.handle_link(update, link) for link in links))
+    
+    async def handle_link(self, update: Update, link: InstagramLink):
+        """Download one link from a message and send it as a reply"""
+        url = link.url
         user = update.effective_user
         
+        if link.kind == 'profile':
+            username = username_from_text(url)
+            await update.message.reply_text(
+                f"That's @{username}'s profile. Use /follow {username} to get their new posts here."
+            )
+            return
+        
         logger.info(f"Download request from {user.id}: {url}")
         
+        # Already uploaded once? Resend by file_id without downloading
+        cache_key = link.key
+        if cache_key and self.file_ids:
+            cached = await self.file_ids.get(cache_key)
+            if cached:
+                try:
+                    await self.send_cached(update.get_bot(), update.effective_chat.id, cached,
+                                           reply_to=self._reply_to(update.message))
+                    self.stats['cache_hits'] += 1
+                    self.stats['downloads'] += 1
+                    REQUESTS.inc(outcome='cache_hit')
+                    return
+                except Exception as e:
+                    # file_id no longer valid - fall back to a fresh download
+                    logger.warning(f"Cached file_id for {cache_key} failed: {e}")
+                    self.stats['cache_misses'] += 1
+            else:
+                self.stats['cache_misses'] += 1
+        
+        # Downloaded before? Upload again from the local store without touching Instagram
+        if cache_key and self.media_store:
+            stored = await self.media_store.get(store_key(cache_key))
+            if stored:
+                try:
+                    with STAGE_SECONDS.time(stage='upload', strategy='store', kind=content_kind(url)), \
+                            UPLOADS_INFLIGHT.track():
+                        entry = await self.send_media(update.get_bot(), update.effective_chat.id, stored,
+                                                      reply_to=self._reply_to(update.message))
+                    UPLOADED_BYTES.inc(stored['size'])
+                    REQUESTS.inc(outcome='store_hit')
+                    if self.file_ids:
+                        await self.file_ids.set(cache_key, entry)
+                    self.stats['downloads'] += 1
+                    self.stats['bytes_sent'] += stored['size']
+                    return
+                except Exception as e:
+                    logger.warning(f"Sending stored media for {cache_key} failed: {e}")
+                finally:
+                    self.media_store.release(store_key(cache_key))
+        
+        # Admission control - refuse early instead of piling up work
+        progress = ProgressReporter()
+        try:
+            job = self.scheduler.submit(
+                user.id,
+                lambda: self.extractor.extract(url, progress),
+                on_discard=self.extractor.cleanup
+            )
+        except SchedulerBusy as e:
+            logger.info(f"Rejected request from {user.id}: {e}")
+            REQUESTS.inc(outcome='rejected')
+            await update.message.reply_text(
+                f"⏳ Busy right now - {e.depth} requests are waiting. Please try again in a minute."
+            )
+            return
+        
         # Send initial status
-        status_msg = await update.message.reply_text("Processing your request...")
+        if job.position > 1:
+            status_msg = await update.message.reply_text(f"Queued - position {job.position}...")
+        else:
+            status_msg = await update.message.reply_text("Processing your request...")
+        progress.attach(status_msg)
         
+        kind = content_kind(url)
+        result = None
         try:
             # Extract content
-            result = await self.extractor.extract(url)
+            result = await job
+            progress.close()
+            STAGE_SECONDS.observe(job.started_at - job.enqueued_at, stage='queue_wait', strategy='', kind=kind)
             
             if not result['success']:
+                REQUESTS.inc(outcome='failed')
                 error_msg = result.get('error', 'Unknown error')
                 if "two-factor" in error_msg.lower():
                     await status_msg.edit_text(
@@ -110,34 +266,270 @@ Just send me any Instagram URL to start!
                 return
             
             # Process result
-            media = await self.extractor.process(result)
+            strategy = result['strategy']
+            with STAGE_SECONDS.time(stage='process', strategy=strategy, kind=kind):
+                media = await self.extractor.process(result)
             
-            await status_msg.edit_text("Sending to Telegram...")
-            
-            # Send to user
-            if media['type'] == 'video':
-                await update.message.reply_video(
-                    video=media['data'],
-                    caption=media.get('caption', '')[:200]  # Telegram caption limit
-                )
-            else:
-                await update.message.reply_photo(
-                    photo=media['data'],
-                    caption=media.get('caption', '')[:200]
+            # The media replaces the status message: send it and delete the status together
+            with STAGE_SECONDS.time(stage='upload', strategy=strategy, kind=kind), UPLOADS_INFLIGHT.track():
+                entry, _ = await asyncio.gather(
+                    self.send_media(update.get_bot(), update.effective_chat.id, media,
+                                    reply_to=self._reply_to(update.message)),
+                    self._delete_status(status_msg),
+                    return_exceptions=True
                 )
+            status_msg = None
+            if isinstance(entry, BaseException):
+                raise entry
+            UPLOADED_BYTES.inc(media['size'])
+            REQUESTS.inc(outcome='ok')
+            
+            if cache_key and self.file_ids:
+                await self.file_ids.set(cache_key, entry)
+            if cache_key and self.media_store:
+                await self.media_store.put(store_key(cache_key), media)
             
             # Update stats
             self.stats['downloads'] += 1
-            self.stats['bytes_sent'] += len(media['data'])
-            
-            await status_msg.delete()
-            await update.message.reply_text("Download complete!")
+            self.stats['bytes_sent'] += media['size']
             
         except Exception as e:
             logger.error(f"Error: {str(e)}")
             self.stats['errors'] += 1
-            await status_msg.edit_text(f"❌ Failed to download: {str(e)[:100]}")
+            REQUESTS.inc(outcome='error')
+            error_text = f"❌ Failed to download: {str(e)[:100]}"
+            if status_msg:
+                await status_msg.edit_text(error_text)
+            else:
+                await update.message.reply_text(error_text)
+        finally:
+            progress.close()
+            # Always drop the request's scratch directory
+            if result:
+                self.extractor.cleanup(result)
+    
+    async def follow_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /follow <username>"""
+        chat_id = update.effective_chat.id
+        username = username_from_text(context.args[0]) if context.args else None
+        if not username:
+            await update.message.reply_text("Usage: /follow <instagram username>")
+            return
+        
+        following = await self.profiles.following(chat_id)
+        if username in following:
+            await update.message.reply_text(f"Already following @{username}")
+            return
+        if len(following) >= config.PROFILE_MAX_FOLLOWS:
+            await update.message.reply_text(
+                f"❌ You can follow at most {config.PROFILE_MAX_FOLLOWS} accounts. Use /unfollow first."
+            )
+            return
+        
+        await self.profiles.follow(username, chat_id)
+        logger.info(f"Chat {chat_id} follows @{username}")
+        await update.message.reply_text(f"Following @{username} - new posts will be sent here.")
+    
+    async def unfollow_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unfollow <username>, or list followed accounts without one"""
+        chat_id = update.effective_chat.id
+        username = username_from_text(context.args[0]) if context.args else None
+        if not username:
+            following = await self.profiles.following(chat_id)
+            if following:
+                accounts = '\n'.join(f"• @{name}" for name in following)
+                await update.message.reply_text(f"Following:\n{accounts}\n\nUsage: /unfollow <username>")
+            else:
+                await update.message.reply_text("Not following anyone. Use /follow <username>.")
+            return
+        
+        if await self.profiles.unfollow(username, chat_id):
+            await update.message.reply_text(f"Unfollowed @{username}")
+        else:
+            await update.message.reply_text(f"Not following @{username}")
+    
+    async def deliver_post(self, chat_ids: List[int], url: str) -> bool:
+        """Download a synced post once and send it to every subscribed chat"""
+        bot = self.app.bot
+        cache_key = shortcode_from_url(url)
+        entry = await self.file_ids.get(cache_key) if self.file_ids else None
+        pending = list(chat_ids)
+        
+        if entry is None:
+            stored = None
+            if cache_key and self.media_store:
+                stored = await self.media_store.get(store_key(cache_key))
+            result = None
+            try:
+                if stored:
+                    media = stored
+                else:
+                    # Queued like any user's request; SchedulerBusy retries on the next sync
+                    result = await self.scheduler.submit(
+                        PROFILE_SYNC_USER,
+                        lambda: self.extractor.extract(url),
+                        on_discard=self.extractor.cleanup
+                    )
+                    if not result['success']:
+                        logger.warning(f"Sync download of {url} failed: {result.get('error')}")
+                        return False
+                    media = await self.extractor.process(result)
+                    if cache_key and self.media_store:
+                        await self.media_store.put(store_key(cache_key), media)
+                # Upload once, then resend the file_id to the other chats
+                while entry is None and pending:
+                    chat_id = pending.pop(0)
+                    try:
+                        entry = await self.send_media(bot, chat_id, media)
+                    except Exception as e:
+                        logger.warning(f"Could not send {url} to {chat_id}: {e}")
+                if entry is None:
+                    return False
+                UPLOADED_BYTES.inc(media['size'])
+                self.stats['bytes_sent'] += media['size']
+            finally:
+                if stored:
+                    self.media_store.release(store_key(cache_key))
+                if result:
+                    self.extractor.cleanup(result)
+            if cache_key and self.file_ids:
+                await self.file_ids.set(cache_key, entry)
+        
+        for chat_id in pending:
+            try:
+                await self.send_cached(bot, chat_id, entry)
+            except Exception as e:
+                logger.warning(f"Could not send {url} to {chat_id}: {e}")
+        REQUESTS.inc(outcome='synced')
+        return True
+    
+    @staticmethod
+    def _reply_to(message: Message) -> Optional[int]:
+        """Quote the request in groups, like Message.reply_* does"""
+        return None if message.chat.type == ChatType.PRIVATE else message.message_id
+    
+    @staticmethod
+    async def _delete_status(status_msg: Message):
+        try:
+            await status_msg.delete()
+        except Exception as e:
+            # Only cosmetic; a leftover status message does no harm
+            logger.warning(f"Could not delete status message: {e}")
+    
+    @staticmethod
+    def _input_media(kind: str, media, caption: Optional[str] = None, **video_details):
+        """Album entry for a video or photo"""
+        if kind == 'video':
+            return InputMediaVideo(media=media, caption=caption, **video_details)
+        return InputMediaPhoto(media=media, caption=caption)
+    
+    @staticmethod
+    def _file_id(message: Message) -> str:
+        """Telegram file_id of the video or (largest) photo in a sent message"""
+        if message.video:
+            return message.video.file_id
+        return message.photo[-1].file_id
+    
+    async def send_media(self, bot: Bot, chat_id: int, media: Dict, reply_to: Optional[int] = None) -> Dict:
+        """Upload downloaded media to a chat and return its file_id cache entry"""
+        caption = media.get('caption', '')[:200]  # Telegram caption limit
+        
+        # Stream files from disk instead of loading them into memory
+        with ExitStack() as stack:
+            def upload(path: str, attach: bool = False) -> InputFile:
+                f = stack.enter_context(open(path, 'rb'))
+                return InputFile(f, filename=os.path.basename(path), attach=attach, read_file_handle=False)
+            
+            def video_details(item: Dict) -> Dict:
+                """Duration, size and thumbnail so Telegram shows a proper player"""
+                if item['type'] != 'video':
+                    return {}
+                details = {key: item[key] for key in ('duration', 'width', 'height') if item.get(key)}
+                if item.get('thumbnail'):
+                    details['thumbnail'] = upload(item['thumbnail'], attach=True)
+                details['supports_streaming'] = True
+                return details
+            
+            if media['type'] == 'album':
+                group = [
+                    self._input_media(item['type'], upload(item['path'], attach=True), caption if i == 0 else None,
+                                      **video_details(item))
+                    for i, item in enumerate(media['items'])
+                ]
+                sent = await bot.send_media_group(chat_id, media=group, reply_to_message_id=reply_to)
+                return {
+                    'type': 'album',
+                    'caption': caption,
+                    'items': [
+                        {'type': item['type'], 'file_id': self._file_id(m)}
+                        for item, m in zip(media['items'], sent)
+                    ]
+                }
+            
+            if media['type'] == 'video':
+                sent = await bot.send_video(
+                    chat_id, video=upload(media['path']), caption=caption, reply_to_message_id=reply_to,
+                    **video_details(media)
+                )
+            else:
+                sent = await bot.send_photo(
+                    chat_id, photo=upload(media['path']), caption=caption, reply_to_message_id=reply_to
+                )
+            return {'type': media['type'], 'file_id': self._file_id(sent), 'caption': caption}
+    
+    async def send_cached(self, bot: Bot, chat_id: int, cached: Dict, reply_to: Optional[int] = None):
+        """Resend previously uploaded media by file_id"""
+        caption = cached.get('caption', '')
+        if cached['type'] == 'album':
+            group = [
+                self._input_media(item['type'], item['file_id'], caption if i == 0 else None)
+                for i, item in enumerate(cached['items'])
+            ]
+            await bot.send_media_group(chat_id, media=group, reply_to_message_id=reply_to)
+        elif cached['type'] == 'video':
+            await bot.send_video(chat_id, video=cached['file_id'], caption=caption, reply_to_message_id=reply_to)
+        else:
+            await bot.send_photo(chat_id, photo=cached['file_id'], caption=caption, reply_to_message_id=reply_to)
     
+    async def prewarm(self):
+        """Load the download engines in the background while updates are already handled"""
+        try:
+            await self.extractor.prewarm()
+        except Exception as e:
+            logger.warning(f"Prewarm failed: {e}")
+            return
+        elapsed = time.perf_counter() - _STARTED
+        STARTUP_SECONDS.set(elapsed, phase='prewarm')
+        logger.info(f"Download engines warm after {elapsed:.2f}s")
+    
+    async def post_init(self, app: Application):
+        """Initialize components inside the application's event loop"""
+        self.app = app
+        await self.initialize()
+        self.profile_sync.start()
+        
+        ready = time.perf_counter() - _STARTED
+        STARTUP_SECONDS.set(IMPORT_SECONDS, phase='imports')
+        STARTUP_SECONDS.set(ready, phase='ready')
+        logger.info(f"Started in {ready:.2f}s (imports {IMPORT_SECONDS:.2f}s)")
+        # Heavy modules load after the bot is up, not before
+        self.prewarm_task = asyncio.ensure_future(self.prewarm())
+        
+    async def shutdown(self, app: Application):
+        """Release worker pools and caches on exit"""
+        if self.prewarm_task:
+            self.prewarm_task.cancel()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await self.profile_sync.close()
+        await self.scheduler.close()
+        await self.extractor.close()
+        await asyncio.get_running_loop().run_in_executor(None, shutdown_executor)
+        if self.file_ids:
+            await self.file_ids.close()
+        if self.media_store:
+            await self.media_store.close()
+        
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors"""
         logger.error(f"Update {update} caused error {context.error}")
@@ -150,10 +542,21 @@ Just send me any Instagram URL to start!
             return
         
         # Create application
-        app = Application.builder().token(self.token).build()
+        app = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(config.CONCURRENT_UPDATES)
+            .post_init(self.post_init)
+            .post_shutdown(self.shutdown)
+            .build()
+        )
         
         # Add handlers
         app.add_handler(CommandHandler("start", self.start_command))
+        app.add_handler(CommandHandler("follow", self.follow_command))
+        app.add_handler(CommandHandler("unfollow", self.unfollow_command))
+        # Updates run concurrently (up to CONCURRENT_UPDATES), so a running
+        # download doesn't hold up other chats
         app.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND, 
             self.handle_url
@@ -162,13 +565,25 @@ Just send me any Instagram URL to start!
         # Add error handler
         app.add_error_handler(self.error_handler)
         
-        # Initialize components
-        asyncio.get_event_loop().run_until_complete(self.initialize())
-        
         # Start bot
-        logger.info("Bot is running... Press Ctrl+C to stop")
-        app.run_polling()
+        if config.BOT_MODE == 'webhook':
+            if not config.WEBHOOK_URL:
+                logger.error("Please set WEBHOOK_URL for webhook mode")
+                return
+            logger.info(f"Bot is running (webhook on port {config.PORT})... Press Ctrl+C to stop")
+            app.run_webhook(
+                listen=config.WEBHOOK_LISTEN,
+                port=config.PORT,
+                url_path=config.WEBHOOK_PATH,
+                webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}",
+                secret_token=config.WEBHOOK_SECRET or None
+            )
+        else:
+            logger.info("Bot is running... Press Ctrl+C to stop")
+            app.run_polling()
 
 if __name__ == "__main__":
+    config.ensure_dirs()
+    setup_logging()
     bot = UltimateInstagramBot()
     bot.run()
@@ -31,3 +31,10 @@ def check_cookie_file(filename):
 
 if __name__ == "__main__":
     check_cookie_file('instagram_cookies.txt')
+    # One jar per account for the rotating cookie pool
+    cookies_dir = os.getenv('COOKIES_DIR', 'cookies')
+    if os.path.isdir(cookies_dir):
+        for name in sorted(os.listdir(cookies_dir)):
+            if name.endswith('.txt'):
+                print()
+                check_cookie_file(os.path.join(cookies_dir, name))
@@ -7,10 +7,23 @@ load_dotenv()
 
 # Telegram
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))  # updates handled in parallel
+
+# Webhook mode (used when WEBHOOK_URL is set, otherwise long polling)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # public base URL, e.g. https://mybot.up.railway.app
+BOT_MODE = os.getenv('BOT_MODE', 'webhook' if WEBHOOK_URL else 'polling')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+PORT = int(os.getenv('PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
 
 # Instagram (optional for higher limits)
 INSTAGRAM_USERNAME = os.getenv('INSTAGRAM_USERNAME', '')
 INSTAGRAM_PASSWORD = os.getenv('INSTAGRAM_PASSWORD', '')
+# One Netscape cookie jar per account (*.txt); requests rotate across them
+COOKIES_DIR = os.getenv('COOKIES_DIR', 'cookies')
+COOKIE_BACKOFF_BASE = float(os.getenv('COOKIE_BACKOFF_BASE', '60'))  # seconds benched after a first 429
+COOKIE_BACKOFF_MAX = float(os.getenv('COOKIE_BACKOFF_MAX', '3600'))
 
 # Database
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
@@ -28,15 +41,78 @@ BASE_DIR = Path(__file__).parent
 LOGS_DIR = BASE_DIR / 'logs'
 CACHE_DIR = BASE_DIR / 'cache'
 TEMP_DIR = BASE_DIR / 'temp'
+# Per-request download workspaces live here (point at tmpfs, e.g. /dev/shm, to keep I/O in RAM)
+WORKSPACE_DIR = Path(os.getenv('WORKSPACE_DIR', str(TEMP_DIR)))
 
-# Create directories
-for dir_path in [LOGS_DIR, CACHE_DIR, TEMP_DIR]:
-    dir_path.mkdir(exist_ok=True)
+def ensure_dirs():
+    """Create runtime directories (called at startup, not on import)"""
+    for dir_path in [LOGS_DIR, CACHE_DIR, TEMP_DIR, WORKSPACE_DIR, Path(COOKIES_DIR)]:
+        dir_path.mkdir(parents=True, exist_ok=True)
 
 # Bot settings
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB (Telegram limit)
+PROGRESS_EDIT_INTERVAL = float(os.getenv('PROGRESS_EDIT_INTERVAL', '3'))  # seconds between status edits per chat, 0 disables
+
+# Download workers
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))  # max parallel downloads
+DOWNLOAD_EXECUTOR = os.getenv('DOWNLOAD_EXECUTOR', 'thread')  # 'thread' or 'process'
+ALBUM_FANOUT = int(os.getenv('ALBUM_FANOUT', '4'))  # parallel carousel items per request
+MAX_ALBUM_ITEMS = 10  # Telegram media group limit
+RESOLVE_CACHE_TTL = int(os.getenv('RESOLVE_CACHE_TTL', '60'))  # seconds a resolved post is reused
+
+# Video post-processing with a local ffmpeg (CPU-bound, separate process pool)
+TRANSCODE_ENABLED = os.getenv('TRANSCODE_ENABLED', '1') == '1'  # shrink videos with no format under MAX_FILE_SIZE
+FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', str(os.cpu_count() or 1)))
+TRANSCODE_PRESET = os.getenv('TRANSCODE_PRESET', 'veryfast')  # x264 preset
+TRANSCODE_MAX_INPUT = int(os.getenv('TRANSCODE_MAX_INPUT_MB', '500')) * 1024 * 1024  # largest source fetched to shrink
+VIDEO_THUMBNAILS = os.getenv('VIDEO_THUMBNAILS', '1') == '1'  # thumbnail/duration/size for sent videos
+
+# Hedged requests: start the next strategy once the current one exceeds its p95 latency
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', '1') == '1'
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '8'))  # seconds, until enough samples exist
+
+# Direct CDN downloads (aiohttp)
+DIRECT_MAX_CONNECTIONS = int(os.getenv('DIRECT_MAX_CONNECTIONS', '100'))
+DIRECT_PER_HOST_LIMIT = int(os.getenv('DIRECT_PER_HOST_LIMIT', '16'))
+DIRECT_SEGMENT_SIZE = int(os.getenv('DIRECT_SEGMENT_SIZE', str(4 * 1024 * 1024)))  # bytes per Range request
+DIRECT_SEGMENTS = int(os.getenv('DIRECT_SEGMENTS', '4'))  # parallel Range requests per file
+
+# Job scheduler (fair queueing across users)
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', str(DOWNLOAD_WORKERS)))  # jobs running at once
+QUEUE_MAX = int(os.getenv('QUEUE_MAX', '100'))  # jobs waiting across all users
+USER_MAX_INFLIGHT = int(os.getenv('USER_MAX_INFLIGHT', '2'))  # running jobs per user
+USER_MAX_QUEUED = int(os.getenv('USER_MAX_QUEUED', '5'))  # waiting jobs per user
+
+# Sharded download workers: BOT_ROLE=frontend sends jobs to `python worker.py` processes
+BOT_ROLE = os.getenv('BOT_ROLE', 'standalone')  # 'standalone' or 'frontend'
+JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE_BACKEND', 'sqlite')  # 'sqlite' (one machine) or 'redis'
+JOB_VISIBILITY_TIMEOUT = float(os.getenv('JOB_VISIBILITY_TIMEOUT', '120'))  # lease before redelivery
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RESULT_TIMEOUT = float(os.getenv('JOB_RESULT_TIMEOUT', '600'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '0.2'))  # first wait on an empty queue
+JOB_POLL_MAX_INTERVAL = float(os.getenv('JOB_POLL_MAX_INTERVAL', '5'))  # doubles up to this while idle
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '4'))  # jobs per worker process
+
+# Prometheus-style metrics endpoint (METRICS_PORT=0 disables it)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# Telegram file_id cache
+FILE_ID_CACHE_BACKEND = os.getenv('FILE_ID_CACHE_BACKEND', 'sqlite')  # 'sqlite', 'redis' or 'none'
+FILE_ID_CACHE_TTL = int(os.getenv('FILE_ID_CACHE_TTL', str(30 * 24 * 3600)))  # seconds
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv('FILE_ID_CACHE_MAX_ENTRIES', '100000'))
+
+# Downloaded media kept on disk (content-addressed, LRU) for repeat requests and re-uploads
+MEDIA_STORE_BUDGET_MB = int(os.getenv('MEDIA_STORE_BUDGET_MB', '2048'))  # 0 disables the store
+
+# Profile sync: /follow <username> pushes an account's new posts to the chat
+PROFILE_SYNC_INTERVAL = int(os.getenv('PROFILE_SYNC_INTERVAL', '900'))  # seconds between syncs, 0 disables
+PROFILE_SYNC_MAX_POSTS = int(os.getenv('PROFILE_SYNC_MAX_POSTS', '12'))  # new posts sent per account per sync
+PROFILE_MAX_FOLLOWS = int(os.getenv('PROFILE_MAX_FOLLOWS', '20'))  # accounts one chat can follow
+# Links to these domains (and their subdomains) are accepted; anything else is ignored
 SUPPORTED_DOMAINS = [
     'instagram.com',
-    'instagr.am',
-    'reels'
+    'instagr.am'
 ]
+MAX_LINKS_PER_MESSAGE = int(os.getenv('MAX_LINKS_PER_MESSAGE', '5'))
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class SQLiteCacheBackend:
+    """Local file_id cache stored in a SQLite database"""
+    
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS file_ids ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'expires_at REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS file_ids_lru ON file_ids (last_used)')
+        self._db.commit()
+    
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT value FROM file_ids WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row:
+                self._db.execute('UPDATE file_ids SET last_used = ? WHERE key = ?', (now, key))
+                self._db.commit()
+        return row[0] if row else None
+    
+    def _set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO file_ids (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)',
+                (key, value, now + self.ttl, now)
+            )
+            # Drop expired rows, then the least recently used ones over the limit
+            self._db.execute('DELETE FROM file_ids WHERE expires_at <= ?', (now,))
+            self._db.execute(
+                'DELETE FROM file_ids WHERE key IN ('
+                'SELECT key FROM file_ids ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self._db.commit()
+    
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+    
+    async def set(self, key: str, value: str):
+        await asyncio.to_thread(self._set, key, value)
+    
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+class RedisCacheBackend:
+    """Shared file_id cache stored in Redis"""
+    
+    INDEX_KEY = 'fileid:lru'
+    
+    def __init__(self, url: str, ttl: int, max_entries: int):
+        import redis.asyncio as redis  # optional dependency
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._redis = redis.from_url(url, decode_responses=True)
+    
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._redis.get(f'fileid:{key}')
+        if value is not None:
+            await self._redis.zadd(self.INDEX_KEY, {key: time.time()})
+        else:
+            await self._redis.zrem(self.INDEX_KEY, key)  # expired entry, if it was indexed
+        return value
+    
+    async def set(self, key: str, value: str):
+        now = time.time()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(f'fileid:{key}', value, ex=self.ttl)
+            # Keys unused for a whole TTL have expired; don't count them against the limit
+            pipe.zremrangebyscore(self.INDEX_KEY, '-inf', now - self.ttl)
+            pipe.zadd(self.INDEX_KEY, {key: now})
+            pipe.zcard(self.INDEX_KEY)
+            *_, size = await pipe.execute()
+        if size > self.max_entries:
+            evicted = await self._redis.zpopmin(self.INDEX_KEY, size - self.max_entries)
+            if evicted:
+                await self._redis.delete(*(f'fileid:{k}' for k, _ in evicted))
+    
+    async def close(self):
+        await self._redis.aclose()
+
+class FileIdCache:
+    """Maps Instagram shortcodes to Telegram file_ids of already uploaded media"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+    
+    async def get(self, key: str) -> Optional[Dict]:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"file_id cache lookup failed: {e}")
+            return None
+        return json.loads(value) if value else None
+    
+    async def set(self, key: str, entry: Dict):
+        try:
+            await self.backend.set(key, json.dumps(entry))
+        except Exception as e:
+            logger.warning(f"file_id cache store failed: {e}")
+    
+    async def close(self):
+        await self.backend.close()
+
+def create_file_id_cache() -> Optional[FileIdCache]:
+    """Build the cache configured by FILE_ID_CACHE_BACKEND ('sqlite', 'redis' or 'none')"""
+    backend = config.FILE_ID_CACHE_BACKEND
+    if backend == 'none':
+        return None
+    if backend == 'redis':
+        return FileIdCache(RedisCacheBackend(
+            config.REDIS_URL, config.FILE_ID_CACHE_TTL, config.FILE_ID_CACHE_MAX_ENTRIES
+        ))
+    return FileIdCache(SQLiteCacheBackend(
+        str(config.CACHE_DIR / 'file_ids.sqlite3'),
+        config.FILE_ID_CACHE_TTL,
+        config.FILE_ID_CACHE_MAX_ENTRIES
+    ))
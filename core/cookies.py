@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+import time
+from itertools import count
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+def find_cookies_file() -> Optional[str]:
+    """Cookie file to use, if any"""
+    if os.path.exists('instagram_cookies.txt'):
+        return 'instagram_cookies.txt'
+    elif os.path.exists('cookies/instagram_cookies.txt'):
+        return 'cookies/instagram_cookies.txt'
+    return None
+
+def is_netscape_cookie_file(path: str) -> bool:
+    """True if every cookie line has the 7 tab-separated Netscape fields"""
+    try:
+        with open(path, 'r', encoding='ascii') as f:
+            lines = [line.strip() for line in f]
+    except (OSError, UnicodeDecodeError):
+        return False
+    cookies = [line for line in lines if line and not line.startswith('#')]
+    return bool(cookies) and all(len(line.split('\t')) == 7 for line in cookies)
+
+# Only signals about the account count. "Login required" in front of one
+# story or private post says nothing about the session and is ignored, as
+# is yt-dlp's catch-all "rate-limit reached or login required".
+RATE_LIMIT_SIGNALS = ('429', 'too many requests', 'toomanyrequests', 'please wait a few minutes', 'feedback_required')
+EXPIRED_SIGNALS = ('checkpoint', 'challenge_required', 'session expired', 'session has expired', 'accounts/login')
+
+def classify_error(error: Exception) -> Optional[str]:
+    """'rate_limit' or 'login' (expired session) for errors that say something about the account
+    
+    Errors rewritten for the user keep the underlying error's text in
+    `original`; that is what gets classified.
+    """
+    message = (getattr(error, 'original', None) or f"{type(error).__name__} {error}").lower()
+    if any(signal in message for signal in RATE_LIMIT_SIGNALS):
+        return 'rate_limit'
+    if any(signal in message for signal in EXPIRED_SIGNALS):
+        return 'login'
+    return None
+
+class CookieSession:
+    """Health of one Instagram account's cookie jar"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = self._mtime()
+        self.failures = 0
+        self.benched_until = 0.0
+        self.last_throttled = 0.0
+        self.requests = 0
+    
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def refreshed(self) -> bool:
+        """Jar was replaced on disk since we last looked"""
+        mtime = self._mtime()
+        if mtime != self.mtime:
+            self.mtime = mtime
+            return True
+        return False
+
+class CookiePool:
+    """Rotates requests over a directory of cookie jars
+    
+    Requests go to the available session that was throttled longest ago,
+    round-robin among equals. Sessions hitting rate limits or expired logins
+    are benched with exponential backoff; a refreshed jar is trusted again.
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, CookieSession] = {}
+        self._dir_mtime = None
+        self._turn = count()
+    
+    def _scan(self):
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        legacy = find_cookies_file()
+        key = (dir_mtime, legacy)
+        if key == self._dir_mtime:
+            return
+        self._dir_mtime = key
+        
+        paths: List[str] = []
+        if dir_mtime is not None:
+            paths = sorted(
+                os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith('.txt')
+            )
+        if legacy and os.path.abspath(legacy) not in {os.path.abspath(p) for p in paths}:
+            paths.append(legacy)
+        
+        sessions = {}
+        for path in paths:
+            if path in self._sessions:
+                sessions[path] = self._sessions[path]
+            elif is_netscape_cookie_file(path):
+                sessions[path] = CookieSession(path)
+            else:
+                logger.warning(f"Skipping {path}: not a Netscape cookie file")
+        self._sessions = sessions
+    
+    def acquire(self) -> Optional[str]:
+        """Cookie file for the next request, or None to go without cookies"""
+        now = time.time()
+        with self._lock:
+            self._scan()
+            available = []
+            for session in self._sessions.values():
+                if session.benched_until > now and session.refreshed():
+                    logger.info(f"{session.path} was refreshed, bringing it back")
+                    session.failures = 0
+                    session.benched_until = 0.0
+                if session.benched_until <= now:
+                    available.append(session)
+            if not available:
+                return None
+            turn = next(self._turn)
+            oldest = min(s.last_throttled for s in available)
+            candidates = [s for s in available if s.last_throttled == oldest]
+            session = candidates[turn % len(candidates)]
+            session.requests += 1
+            return session.path
+    
+    def accounts(self) -> List[str]:
+        """Cookie files of the sessions that are not benched"""
+        now = time.time()
+        with self._lock:
+            self._scan()
+            return [s.path for s in self._sessions.values() if s.benched_until <= now]
+    
+    def report(self, path: Optional[str], error: Optional[Exception] = None):
+        """Record how a request made with this cookie file went"""
+        if not path:
+            return
+        problem = classify_error(error) if error else None
+        if error and not problem:
+            return  # unrelated to the account
+        
+        with self._lock:
+            session = self._sessions.get(path)
+            if session is None:
+                return
+            if problem is None:
+                session.failures = 0
+                return
+            
+            session.failures += 1
+            session.last_throttled = time.time()
+            backoff = min(config.COOKIE_BACKOFF_BASE * 2 ** (session.failures - 1), config.COOKIE_BACKOFF_MAX)
+            if problem == 'login':
+                # Expired session - wait for a refreshed jar or the longest backoff
+                backoff = config.COOKIE_BACKOFF_MAX
+            session.benched_until = session.last_throttled + backoff
+            session.refreshed()
+            logger.warning(f"Benching {path} for {backoff:.0f}s ({problem})")
+    
+    def stats(self) -> Dict[str, Dict]:
+        now = time.time()
+        with self._lock:
+            return {
+                path: {
+                    'requests': s.requests,
+                    'failures': s.failures,
+                    'benched_for': max(0.0, s.benched_until - now)
+                }
+                for path, s in self._sessions.items()
+            }
+
+COOKIE_POOL = CookiePool(str(config.COOKIES_DIR))
@@ -0,0 +1,103 @@
+import asyncio
+import importlib.util
+import threading
+from http.cookiejar import MozillaCookieJar
+from typing import Callable, Dict, Iterator, Optional
+
+import config
+from core.cookies import COOKIE_POOL
+from core.metrics import DOWNLOADED_BYTES, STAGE_SECONDS
+from core.urls import content_kind, shortcode_from_url
+from core.extractors.workers import get_executor
+
+_local = threading.local()
+
+def _loader(cookies_file: Optional[str]) -> 'instaloader.Instaloader':
+    """One Instaloader per worker thread and account (its HTTP session isn't thread-safe)"""
+    loaders = getattr(_local, 'loaders', None)
+    if loaders is None:
+        loaders = _local.loaders = {}
+    loader = loaders.get(cookies_file)
+    if loader is None:
+        import instaloader
+        loader = instaloader.Instaloader(
+            quiet=True,
+            download_video_thumbnails=False,
+            save_metadata=False,
+            max_connection_attempts=1
+        )
+        if cookies_file:
+            jar = MozillaCookieJar(cookies_file)
+            jar.load(ignore_discard=True, ignore_expires=True)
+            loader.load_session('', {c.name: c.value for c in jar if 'instagram' in c.domain})
+        loaders[cookies_file] = loader
+    return loader
+
+def instaloader_resolve(shortcode: str, cookies_file: Optional[str] = None) -> Dict:
+    """Look up a post through Instagram's GraphQL API and list its media URLs"""
+    import instaloader
+    post = instaloader.Post.from_shortcode(_loader(cookies_file).context, shortcode)
+    
+    if post.typename == 'GraphSidecar':
+        nodes = list(post.get_sidecar_nodes())[:config.MAX_ALBUM_ITEMS]
+        media = [
+            {'url': node.video_url if node.is_video else node.display_url, 'is_video': node.is_video}
+            for node in nodes
+        ]
+    else:
+        media = [{'url': post.video_url if post.is_video else post.url, 'is_video': post.is_video}]
+    
+    return {
+        'media': media,
+        'url': f'https://www.instagram.com/p/{shortcode}/',
+        'title': post.caption or '',
+        'author': post.owner_username
+    }
+
+def instaloader_profile_posts(username: str, cookies_file: Optional[str] = None) -> Iterator:
+    """An account's posts, newest first; each page is fetched as the iterator advances"""
+    import instaloader
+    profile = instaloader.Profile.from_username(_loader(cookies_file).context, username)
+    return profile.get_posts()
+
+class InstaloaderStrategy:
+    """Backup strategy: metadata via instaloader, bytes via the direct CDN fetcher"""
+    
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+    
+    @staticmethod
+    def available() -> bool:
+        # Optional backup strategy; imported on first use
+        return importlib.util.find_spec('instaloader') is not None
+    
+    async def download(self, url: str, progress: Optional[Callable] = None) -> Dict:
+        shortcode = shortcode_from_url(url)
+        if not shortcode or shortcode.startswith('story:'):
+            raise Exception("Instaloader strategy only handles posts and reels")
+        
+        kind = content_kind(url)
+        cookies_file = COOKIE_POOL.acquire()
+        try:
+            with STAGE_SECONDS.time(stage='resolve', strategy='instaloader', kind=kind):
+                resolved = await asyncio.wrap_future(
+                    get_executor().submit(instaloader_resolve, shortcode, cookies_file)
+                )
+        except Exception as e:
+            COOKIE_POOL.report(cookies_file, e)
+            raise
+        COOKIE_POOL.report(cookies_file)
+        entries = [
+            {'url': m['url'], 'id': f'{shortcode}-{i}', 'ext': 'mp4' if m['is_video'] else 'jpg'}
+            for i, m in enumerate(resolved['media'])
+        ]
+        with STAGE_SECONDS.time(stage='download', strategy='instaloader', kind=kind):
+            fetched = await self.fetcher.fetch_all(entries, progress)
+        DOWNLOADED_BYTES.inc(sum(item['filesize'] for item in fetched['items']), strategy='instaloader')
+        return {
+            'items': fetched['items'],
+            'url': resolved['url'],
+            'title': resolved['title'] or 'Instagram content',
+            'author': resolved['author'],
+            'workspace': fetched['workspace']
+        }
@@ -0,0 +1,104 @@
+import functools
+import os
+import re
+import shutil
+import subprocess
+from typing import Dict, Optional
+
+import config
+
+_DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+_VIDEO_RE = re.compile(r'Stream #.*?Video: .*?(\d{2,5})x(\d{2,5})')
+
+AUDIO_BITRATE = 96_000
+# Heights tried as the bitrate budget shrinks (bits/s needed for each to look acceptable)
+LADDER = ((1080, 3_000_000), (720, 1_200_000), (480, 500_000), (360, 0))
+
+@functools.lru_cache(maxsize=1)
+def ffmpeg_available() -> bool:
+    return shutil.which(config.FFMPEG_PATH) is not None
+
+def transcoding_enabled() -> bool:
+    """Oversized videos get shrunk: switched on and ffmpeg is installed"""
+    return config.TRANSCODE_ENABLED and ffmpeg_available()
+
+def _ffmpeg(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [config.FFMPEG_PATH, '-hide_banner', '-nostdin', *args],
+        capture_output=True, text=True
+    )
+
+def probe(path: str) -> Dict:
+    """Duration (s), width and height of a video, read from ffmpeg's stream info"""
+    stderr = _ffmpeg('-i', path).stderr  # exits non-zero without an output file; that's fine
+    info = {}
+    match = _DURATION_RE.search(stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = _VIDEO_RE.search(stderr)
+    if match:
+        info['width'], info['height'] = int(match.group(1)), int(match.group(2))
+    return info
+
+def shrink(path: str, max_bytes: int, info: Dict) -> str:
+    """Re-encode a video to fit max_bytes, downscaling as the bitrate budget requires"""
+    duration = info.get('duration')
+    if not duration:
+        raise Exception("Can't transcode: unknown video duration")
+    base, _ = os.path.splitext(path)
+    output = f'{base}.small.mp4'
+    target = max_bytes * 0.95  # container overhead
+    
+    for _ in range(3):
+        video_bitrate = int(target * 8 / duration) - AUDIO_BITRATE
+        if video_bitrate < 100_000:
+            raise Exception("Video is too long to fit under the size limit")
+        height = next(h for h, needed in LADDER if video_bitrate >= needed)
+        height = min(height, info.get('height') or height)
+        result = _ffmpeg(
+            '-y', '-i', path,
+            '-vf', f'scale=-2:{height}',
+            '-c:v', 'libx264', '-preset', config.TRANSCODE_PRESET,
+            '-b:v', str(video_bitrate), '-maxrate', str(video_bitrate), '-bufsize', str(video_bitrate * 2),
+            '-c:a', 'aac', '-b:a', str(AUDIO_BITRATE),
+            '-movflags', '+faststart',
+            output
+        )
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg failed: {result.stderr.strip().splitlines()[-1:]}")
+        if os.path.getsize(output) <= max_bytes:
+            os.remove(path)
+            return output
+        target *= 0.85  # overshot the rate control; aim lower
+    raise Exception("Could not shrink the video under the size limit")
+
+def thumbnail(path: str, duration: Optional[float]) -> Optional[str]:
+    """JPEG preview for Telegram (at most 320px on the long side)"""
+    output = f'{os.path.splitext(path)[0]}.thumb.jpg'
+    at = min(1.0, (duration or 0) / 2)
+    result = _ffmpeg(
+        '-y', '-ss', f'{at:.2f}', '-i', path, '-frames:v', '1',
+        '-vf', "scale='if(gt(iw,ih),320,-2)':'if(gt(iw,ih),-2,320)'", '-q:v', '5',
+        output
+    )
+    if result.returncode != 0 or not os.path.exists(output):
+        return None
+    return output
+
+def prepare_video(path: str, max_bytes: int) -> Dict:
+    """Post-process one downloaded video; runs on the transcode pool
+    
+    Shrinks it when it is over max_bytes and collects what reply_video
+    needs: duration, dimensions and a thumbnail.
+    """
+    info = probe(path)
+    if os.path.getsize(path) > max_bytes:
+        path = shrink(path, max_bytes, info)
+        info = probe(path)
+    result = {'filepath': path, 'filesize': os.path.getsize(path), **info}
+    if info.get('duration'):
+        result['duration'] = round(info['duration'])
+    if config.VIDEO_THUMBNAILS:
+        result['thumbnail'] = thumbnail(path, info.get('duration'))
+    return result
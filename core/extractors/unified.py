@@ -1,45 +1,371 @@
 import asyncio
 import aiohttp
-import yt_dlp
-from typing import Dict, Any, Optional
-import hashlib
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional
 from datetime import datetime
+import functools
 import json
 import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
 import config
+from core.urls import content_kind, shortcode_from_url
+from core.cookies import COOKIE_POOL, classify_error
+from core.metrics import DOWNLOADED_BYTES, DOWNLOADS_INFLIGHT, STAGE_SECONDS
+from core.extractors.workers import (
+    get_executor, get_transcode_executor, shutdown_executor, create_workspace, remove_workspace
+)
+from core.extractors.transcode import ffmpeg_available, prepare_video, transcoding_enabled
+from core.extractors.instaloader_strategy import InstaloaderStrategy
+
+if TYPE_CHECKING:
+    import yt_dlp  # imported on first use, it's slow to load
+
+class MediaTooLargeError(Exception):
+    """No available format fits under config.MAX_FILE_SIZE"""
+    
+    def __init__(self, size: Optional[int] = None):
+        limit_mb = config.MAX_FILE_SIZE / (1024 * 1024)
+        if size:
+            message = f"Media is too large for Telegram ({size / (1024 * 1024):.0f} MB, limit {limit_mb:.0f} MB)"
+        else:
+            message = f"Media is too large for Telegram (limit {limit_mb:.0f} MB)"
+        super().__init__(message)
+        self.size = size
+    
+    def __reduce__(self):
+        # Rebuilt from the size when it crosses back from a worker process
+        return type(self), (self.size,)
+
+class DownloadError(Exception):
+    """Failure explained for the user; `original` keeps the underlying error for classify_error"""
+    
+    def __init__(self, message: str, original: str = ''):
+        super().__init__(message)
+        self.original = original
+    
+    def __reduce__(self):
+        return type(self), (str(self), self.original)
+
+def format_size(fmt: Dict, duration: Optional[float] = None) -> Optional[int]:
+    """Known or estimated size of a format in bytes"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration  # tbr is in kbit/s
+    return int(size) if size else None
+
+def _quality(fmt: Dict) -> tuple:
+    return (fmt.get('height') or 0, fmt.get('tbr') or 0)
+
+def fitting_formats(target: Dict, max_bytes: int, progressive_only: bool = False) -> List[tuple]:
+    """(format spec, size, formats) choices that fit under max_bytes, best first
+    
+    Choices with a known size come before ones whose size is unknown.
+    Raises MediaTooLargeError when every choice is known to be too large.
+    """
+    formats = target.get('formats') or []
+    duration = target.get('duration')
+    
+    def is_video(f):
+        return f.get('vcodec') != 'none'
+    
+    def is_audio(f):
+        return f.get('acodec') != 'none'
+    
+    choices = [((f.get('format_id'),), [f]) for f in formats if is_video(f) and is_audio(f)]
+    if not progressive_only:
+        # Video-only streams paired with the best audio that still fits
+        audios = sorted((f for f in formats if is_audio(f) and not is_video(f)),
+                        key=lambda f: f.get('abr') or f.get('tbr') or 0, reverse=True)
+        for video in (f for f in formats if is_video(f) and not is_audio(f)):
+            for audio in audios:
+                choices.append(((video.get('format_id'), audio.get('format_id')), [video, audio]))
+    
+    known, unknown, smallest = [], [], None
+    for ids, parts in choices:
+        sizes = [format_size(f, duration) for f in parts]
+        size = sum(sizes) if None not in sizes else None
+        entry = ('+'.join(i for i in ids if i), size, parts)
+        if size is None:
+            unknown.append(entry)
+        elif size <= max_bytes:
+            known.append(entry)
+        else:
+            smallest = size if smallest is None else min(smallest, size)
+    
+    if choices and not known and not unknown:
+        raise MediaTooLargeError(smallest)
+    
+    def rank(entry):
+        return _quality(entry[2][0])
+    return sorted(known, key=rank, reverse=True) + sorted(unknown, key=rank, reverse=True)
+
+def fits(target: Dict, progressive_only: bool = False) -> bool:
+    """Whether any format (of known or unknown size) may fit under MAX_FILE_SIZE"""
+    try:
+        return bool(fitting_formats(target, config.MAX_FILE_SIZE, progressive_only))
+    except MediaTooLargeError:
+        return False
+
+def download_limit() -> int:
+    """Largest file worth fetching: oversized videos can still be shrunk when transcoding is on"""
+    return config.TRANSCODE_MAX_INPUT if transcoding_enabled() else config.MAX_FILE_SIZE
+
+def download_choices(target: Dict, progressive_only: bool = False) -> List[tuple]:
+    """fitting_formats() under MAX_FILE_SIZE
+    
+    When nothing fits and transcoding is on, the formats under
+    TRANSCODE_MAX_INPUT instead, smallest first, to be shrunk afterwards.
+    """
+    try:
+        return fitting_formats(target, config.MAX_FILE_SIZE, progressive_only)
+    except MediaTooLargeError:
+        if not transcoding_enabled():
+            raise
+    choices = fitting_formats(target, config.TRANSCODE_MAX_INPUT, progressive_only)
+    return sorted(choices, key=lambda entry: entry[1] if entry[1] is not None else float('inf'))
+
+def select_format(target: Dict) -> Optional[str]:
+    """yt-dlp format spec for the best format under the limit, None for the default"""
+    if not target.get('formats'):
+        size = format_size(target)
+        if size and size > download_limit():
+            raise MediaTooLargeError(size)
+        return None
+    # Separate video and audio streams need ffmpeg to be merged
+    choices = download_choices(target, progressive_only=not ffmpeg_available())
+    return choices[0][0] if choices and choices[0][0] else None
+
+class StrategyTracker:
+    """Rolling latency and success rate per strategy and content kind"""
+    
+    MIN_SAMPLES = 5
+    
+    def __init__(self, window: int = 100):
+        self._samples: Dict[tuple, deque] = defaultdict(lambda: deque(maxlen=window))
+    
+    def record(self, strategy_name: str, kind: str, ok: bool, seconds: float):
+        self._samples[(strategy_name, kind)].append((ok, seconds))
+    
+    def success_rate(self, strategy_name: str, kind: str) -> float:
+        samples = self._samples[(strategy_name, kind)]
+        if len(samples) < self.MIN_SAMPLES:
+            return 1.0  # not enough data - assume it works
+        return sum(ok for ok, _ in samples) / len(samples)
+    
+    def percentile(self, strategy_name: str, kind: str, q: float) -> Optional[float]:
+        """Latency percentile (0-100) of successful runs, None without enough data"""
+        latencies = sorted(seconds for ok, seconds in self._samples[(strategy_name, kind)] if ok)
+        if len(latencies) < self.MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))]
+    
+    def order(self, kind: str, names: List[str]) -> List[str]:
+        """Most reliable first, then fastest; registration order breaks ties"""
+        def score(name):
+            p50 = self.percentile(name, kind, 50)
+            return (-round(self.success_rate(name, kind), 1), p50 if p50 is not None else float('inf'))
+        return sorted(names, key=score)
+    
+    def hedge_delay(self, strategy_name: str, kind: str) -> float:
+        """How long to wait for a strategy before starting a backup"""
+        p95 = self.percentile(strategy_name, kind, 95)
+        return p95 if p95 is not None else config.HEDGE_DEFAULT_DELAY
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """Per 'strategy/kind' success rate and latency percentiles"""
+        return {
+            f'{name}/{kind}': {
+                'samples': len(samples),
+                'success_rate': self.success_rate(name, kind),
+                'p50': self.percentile(name, kind, 50),
+                'p95': self.percentile(name, kind, 95)
+            }
+            for (name, kind), samples in self._samples.items()
+        }
+
+class _Flight:
+    """One in-progress extraction shared by every caller asking for the same media"""
+    
+    def __init__(self):
+        self.future: Optional[asyncio.Future] = None
+        self.holders = 0
+        self.listeners: List[Callable] = []
+    
+    def progress(self, item: int, downloaded: int, total: Optional[int]):
+        """Pass download progress on to every caller sharing this flight"""
+        for listener in self.listeners:
+            listener(item, downloaded, total)
 
 class UnifiedExtractor:
     """Extracts content using multiple strategies"""
     
     def __init__(self):
+        ytdlp = YTDLPStrategy()
+        direct = DirectMediaStrategy(ytdlp)
         self.strategies = {
-            'ytdlp': YTDLPStrategy(),
+            'direct': direct,
+            'ytdlp': ytdlp,
         }
+        if InstaloaderStrategy.available():
+            self.strategies['instaloader'] = InstaloaderStrategy(direct)
         self.stats = {name: {'success': 0, 'fail': 0} for name in self.strategies}
+        self.tracker = StrategyTracker()
+        self.coalesced = 0
+        self._inflight: Dict[str, _Flight] = {}
+        self._by_workspace: Dict[str, _Flight] = {}
         
-    async def extract(self, url: str) -> Dict[str, Any]:
-        """Try all strategies until one works"""
+    async def extract(self, url: str, progress: Optional[Callable] = None) -> Dict[str, Any]:
+        """Extract media, sharing one run between concurrent requests for the same post
         
-        # Try strategies in order
-        for strategy_name, strategy in self.strategies.items():
-            try:
-                print(f"Trying {strategy_name}...")
-                result = await strategy.download(url)
-                
-                # Update stats
-                self.stats[strategy_name]['success'] += 1
+        progress(item, downloaded, total) is called in the event loop as
+        bytes arrive. Every successful result must be handed back to
+        cleanup() once sent.
+        """
+        key = shortcode_from_url(url) or url
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.future = asyncio.ensure_future(self.extract_once(url, flight.progress))
+            self._inflight[key] = flight
+            flight.future.add_done_callback(lambda _: self._landed(key, flight))
+        else:
+            print(f"Joining in-flight extraction for {key}")
+            self.coalesced += 1
+        
+        flight.holders += 1
+        if progress:
+            flight.listeners.append(progress)
+        try:
+            return await asyncio.shield(flight.future)
+        except BaseException:
+            self._release(flight)
+            raise
+        finally:
+            if progress:
+                flight.listeners.remove(progress)
+    
+    async def prewarm(self):
+        """Load yt-dlp and one pooled instance per account ahead of the first request"""
+        accounts = COOKIE_POOL.accounts() or [None]
+        await asyncio.gather(*(
+            asyncio.wrap_future(get_executor().submit(ytdlp_prewarm, cookies_file))
+            for cookies_file in accounts
+        ))
+    
+    def _landed(self, key: str, flight: _Flight):
+        """Stop accepting joiners and index the shared artifact by workspace"""
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if flight.future.cancelled() or flight.future.exception():
+            return
+        result = flight.future.result()
+        if result['success']:
+            self._by_workspace[result['data']['workspace']] = flight
+    
+    def _release(self, flight: _Flight):
+        """Drop one holder; the last one out removes the downloaded files"""
+        flight.holders -= 1
+        if flight.holders > 0:
+            return
+        if not flight.future.done():
+            # Nobody is waiting any more
+            flight.future.cancel()
+            return
+        if flight.future.cancelled() or flight.future.exception():
+            return
+        result = flight.future.result()
+        if result['success']:
+            workspace = result['data']['workspace']
+            self._by_workspace.pop(workspace, None)
+            remove_workspace(workspace)
+    
+    async def extract_once(self, url: str, progress: Optional[Callable] = None) -> Dict[str, Any]:
+        """Try strategies fastest-first, hedging with the next one when the current one is slow
+        
+        Not shared with other callers; the caller owns the returned workspace.
+        """
+        kind = content_kind(url)
+        queue = self.tracker.order(kind, list(self.strategies))
+        pending: Dict[asyncio.Future, tuple] = {}
+        
+        def launch():
+            strategy_name = queue.pop(0)
+            print(f"Trying {strategy_name}...")
+            task = asyncio.ensure_future(self.strategies[strategy_name].download(url, progress))
+            pending[task] = (strategy_name, time.monotonic())
+            DOWNLOADS_INFLIGHT.inc(strategy=strategy_name)
+            task.add_done_callback(lambda _: DOWNLOADS_INFLIGHT.dec(strategy=strategy_name))
+            return strategy_name
+        
+        try:
+            latest = launch()
+            while pending:
+                # Wait up to the latest strategy's p95 before starting a backup
+                timeout = self.tracker.hedge_delay(latest, kind) if queue and config.HEDGE_ENABLED else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print(f"{latest} is slow, hedging...")
+                    latest = launch()
+                    continue
                 
-                return {
-                    'success': True,
-                    'strategy': strategy_name,
-                    'data': result,
-                    'timestamp': datetime.now().isoformat()
-                }
+                winner = None
+                too_large = None
+                for task in done:
+                    strategy_name, started = pending.pop(task)
+                    elapsed = time.monotonic() - started
+                    if isinstance(task.exception(), MediaTooLargeError):
+                        # Not the strategy's fault - no other strategy will do better
+                        too_large = task.exception()
+                    elif task.exception() is None:
+                        self.tracker.record(strategy_name, kind, True, elapsed)
+                        # Update stats
+                        self.stats[strategy_name]['success'] += 1
+                        if winner is None:
+                            winner = (strategy_name, task.result())
+                        else:
+                            # Both finished at once; keep one download
+                            remove_workspace(task.result().get('workspace'))
+                    else:
+                        print(f"{strategy_name} failed: {str(task.exception())}")
+                        self.tracker.record(strategy_name, kind, False, elapsed)
+                        self.stats[strategy_name]['fail'] += 1
                 
-            except Exception as e:
-                print(f"{strategy_name} failed: {str(e)}")
-                self.stats[strategy_name]['fail'] += 1
-                continue
+                if winner:
+                    for task in pending:
+                        task.cancel()
+                    pending.clear()
+                    try:
+                        data = await self.postprocess(winner[1], winner[0], kind)
+                    except Exception as e:
+                        print(f"Post-processing failed: {e}")
+                        return {
+                            'success': False,
+                            'error': str(e),
+                            'stats': self.stats
+                        }
+                    return {
+                        'success': True,
+                        'strategy': winner[0],
+                        'data': data,
+                        'timestamp': datetime.now().isoformat()
+                    }
+                if too_large:
+                    print(f"Giving up: {too_large}")
+                    return {
+                        'success': False,
+                        'error': str(too_large),
+                        'stats': self.stats
+                    }
+                if not pending and queue:
+                    latest = launch()
+        finally:
+            # First success wins; the losers clean up their own workspaces
+            for task in pending:
+                task.cancel()
         
         return {
             'success': False,
@@ -47,36 +373,57 @@ class UnifiedExtractor:
             'stats': self.stats
         }
     
+    async def postprocess(self, data: Dict, strategy_name: str, kind: str) -> Dict:
+        """Shrink oversized videos and add duration, size and thumbnail for reply_video
+        
+        ffmpeg runs on its own process pool, so CPU-heavy encodes don't
+        compete with the network-bound download workers. The workspace is
+        removed if this fails.
+        """
+        items = data['items']
+        for item in items:
+            if not item.get('is_video') and item['filesize'] > config.MAX_FILE_SIZE:
+                remove_workspace(data['workspace'])
+                raise MediaTooLargeError(item['filesize'])
+        
+        videos = [item for item in items if item.get('is_video')]
+        if not videos or not ffmpeg_available():
+            return data
+        if not config.VIDEO_THUMBNAILS and all(v['filesize'] <= config.MAX_FILE_SIZE for v in videos):
+            return data
+        
+        futures = [
+            get_transcode_executor().submit(prepare_video, item['filepath'], config.MAX_FILE_SIZE)
+            for item in videos
+        ]
+        try:
+            with STAGE_SECONDS.time(stage='transcode', strategy=strategy_name, kind=kind):
+                results = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures), return_exceptions=True)
+        except BaseException:
+            cleanup_after(futures, data['workspace'])
+            raise
+        
+        for item, result in zip(videos, results):
+            if not isinstance(result, BaseException):
+                item.update(result)
+            elif item['filesize'] > config.MAX_FILE_SIZE:
+                remove_workspace(data['workspace'])
+                raise MediaTooLargeError(item['filesize']) from result
+            else:
+                print(f"No video details for {item['filepath']}: {result}")
+        return data
+    
     async def process(self, raw_result: Dict) -> Dict:
         """Process raw result into final format"""
         if not raw_result['success']:
             raise Exception(raw_result['error'])
         
         data = raw_result['data']
+        items = [self._media_item(item) for item in data['items']]
         
-        # Determine content type
-        content_type = 'unknown'
-        if data.get('is_video', False):
-            content_type = 'video'
-        elif data.get('is_image', False):
-            content_type = 'photo'
-        else:
-            # Try to detect from data
-            if isinstance(data.get('content'), bytes):
-                # Check first few bytes for image signatures
-                if len(data['content']) > 2 and data['content'][:2] == b'\xff\xd8':  # JPEG
-                    content_type = 'photo'
-                elif len(data['content']) > 4 and data['content'][:4] == b'\x89PNG':  # PNG
-                    content_type = 'photo'
-                elif len(data['content']) > 4 and data['content'][:4] == b'GIF8':  # GIF
-                    content_type = 'photo'
-                else:
-                    content_type = 'video'  # Assume video
-        
-        return {
-            'type': content_type,
-            'data': data['content'],
+        media = {
             'caption': data.get('caption', '') or data.get('title', ''),
+            'size': sum(item['size'] for item in items),
             'metadata': {
                 'url': data.get('url', ''),
                 'author': data.get('author', ''),
@@ -84,139 +431,599 @@ class UnifiedExtractor:
                 'strategy': raw_result['strategy']
             }
         }
+        if len(items) == 1:
+            media.update(items[0])
+        else:
+            # Carousel - sent as one Telegram album
+            media['type'] = 'album'
+            media['items'] = items
+        return media
+    
+    @staticmethod
+    def _media_item(item: Dict) -> Dict:
+        """Final type/path/size for one downloaded file"""
+        # Determine content type
+        content_type = 'unknown'
+        if item.get('is_video', False):
+            content_type = 'video'
+        elif item.get('is_image', False):
+            content_type = 'photo'
+        else:
+            # Try to detect from the file header
+            with open(item['filepath'], 'rb') as f:
+                header = f.read(4)
+            if header[:2] == b'\xff\xd8':  # JPEG
+                content_type = 'photo'
+            elif header == b'\x89PNG':  # PNG
+                content_type = 'photo'
+            elif header == b'GIF8':  # GIF
+                content_type = 'photo'
+            else:
+                content_type = 'video'  # Assume video
+        
+        media_item = {
+            'type': content_type,
+            'path': item['filepath'],
+            'size': item['filesize']
+        }
+        # Video details from post-processing, for reply_video
+        for key in ('duration', 'width', 'height', 'thumbnail'):
+            if item.get(key):
+                media_item[key] = item[key]
+        return media_item
+    
+    async def close(self):
+        """Close network sessions held by the strategies"""
+        for strategy in self.strategies.values():
+            if hasattr(strategy, 'close'):
+                await strategy.close()
+    
+    def cleanup(self, raw_result: Dict):
+        """Release a result from extract(); files go once every sharer is done"""
+        if not raw_result.get('success'):
+            return
+        workspace = raw_result['data'].get('workspace')
+        flight = self._by_workspace.get(workspace)
+        if flight:
+            self._release(flight)
+        else:
+            remove_workspace(workspace)
+
+def downloaded_path(ydl, info: Dict) -> str:
+    """Exact output path reported by yt-dlp for a processed info dict"""
+    downloads = info.get('requested_downloads') or [{}]
+    filename = downloads[0].get('filepath') or info.get('filepath') or ydl.prepare_filename(info)
+    if not os.path.exists(filename):
+        raise Exception("Downloaded file not found (it may exceed the size limit)")
+    return filename
+
+async def gather_or_cancel(aws) -> List:
+    """asyncio.gather that cancels the other tasks, and waits for them, once one fails"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def cleanup_after(futures: List[Future], workspace: str):
+    """Remove the workspace once every submitted worker job has stopped"""
+    # Jobs that haven't started yet are simply dropped
+    running = [f for f in futures if not f.cancel() and not f.done()]
+    if not running:
+        remove_workspace(workspace)
+        return
+    
+    lock = threading.Lock()
+    remaining = [len(running)]
+    
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        remove_workspace(workspace)
+    
+    for future in running:
+        future.add_done_callback(on_done)
 
 class YTDLPStrategy:
-    async def download(self, url: str) -> Dict:
-        """Download using yt-dlp with cookies - supports reels, posts, images, and carousels"""
-        
-        # Check for cookies file
-        cookies_file = None
-        if os.path.exists('instagram_cookies.txt'):
-            cookies_file = 'instagram_cookies.txt'
-            print(f"Using cookies from {cookies_file}")
-        elif os.path.exists('cookies/instagram_cookies.txt'):
-            cookies_file = 'cookies/instagram_cookies.txt'
-            print(f"Using cookies from {cookies_file}")
-        
-        # Detect content type
-        is_story = '/stories/' in url
-        is_post = '/p/' in url or '/reel/' in url
-        
-        # Base options
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'outtmpl': 'temp/%(id)s.%(ext)s',
-        }
+    def __init__(self):
+        self._resolved: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._resolving: Dict[str, asyncio.Future] = {}
+    
+    async def resolve(self, url: str) -> Dict:
+        """Resolve metadata on the worker pool, reusing a recent result for the same URL"""
+        cached = self._resolved.get(url)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
         
-        # Add cookies if available
-        if cookies_file:
-            ydl_opts['cookiefile'] = cookies_file
-        elif config.INSTAGRAM_USERNAME and config.INSTAGRAM_PASSWORD:
-            ydl_opts['username'] = config.INSTAGRAM_USERNAME
-            ydl_opts['password'] = config.INSTAGRAM_PASSWORD
+        # Hedged strategies resolving the same post share one lookup
+        future = self._resolving.get(url)
+        if future is None:
+            future = asyncio.ensure_future(self._resolve(url))
+            self._resolving[url] = future
+            future.add_done_callback(lambda f: self._resolved_done(url, f))
+        return await asyncio.shield(future)
+    
+    async def _resolve(self, url: str) -> Dict:
+        # The account is picked here, in the event loop, so the pool sees
+        # every outcome even when the lookup runs in a worker process
+        cookies_file = COOKIE_POOL.acquire()
+        try:
+            with STAGE_SECONDS.time(stage='resolve', strategy='ytdlp', kind=content_kind(url)):
+                resolved = await asyncio.wrap_future(get_executor().submit(ytdlp_resolve, url, cookies_file))
+        except Exception as e:
+            COOKIE_POOL.report(cookies_file, e)
+            raise
+        COOKIE_POOL.report(cookies_file)
+        return dict(resolved, cookies_file=cookies_file)
+    
+    def _resolved_done(self, url: str, future: asyncio.Future):
+        del self._resolving[url]
+        if future.cancelled() or future.exception():
+            return
+        # Short-lived, so a fallback strategy doesn't resolve the same post again
+        self._resolved[url] = (time.monotonic() + config.RESOLVE_CACHE_TTL, future.result())
+        self._resolved.move_to_end(url)
+        while len(self._resolved) > 256:
+            self._resolved.popitem(last=False)
+    
+    async def download(self, url: str, progress: Optional[Callable] = None) -> Dict:
+        """Resolve once, then download every item on the shared worker pool"""
+        workspace = create_workspace()
+        futures: List[Future] = []
+        loop = asyncio.get_running_loop()
         
-        # Ensure temp directory exists
-        os.makedirs('temp', exist_ok=True)
+        async def run(func, *args):
+            future = get_executor().submit(func, *args)
+            futures.append(future)
+            return await asyncio.wrap_future(future)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        try:
+            resolved = await self.resolve(url)
+            targets = resolved['targets']
+            cookies_file = resolved['cookies_file']
+            
+            # Carousel items are fetched in parallel, a few at a time per request
+            fanout = asyncio.Semaphore(config.ALBUM_FANOUT)
+            
+            async def fetch(index: int, target: Dict) -> Dict:
+                hook = None
+                if progress and config.DOWNLOAD_EXECUTOR != 'process':
+                    # Callbacks can't cross into worker processes; there is no progress there
+                    hook = ProgressHook(loop, progress, index)
+                async with fanout:
+                    return await run(ytdlp_download_item, url, target, workspace, index, cookies_file, hook)
+            
+            tasks = [asyncio.ensure_future(fetch(i, t)) for i, t in enumerate(targets)]
             try:
-                # First extract info without downloading to check what it is
-                info = ydl.extract_info(url, download=False)
-                
-                # Check if it's a playlist (carousel)
-                if 'entries' in info:
-                    entries_count = len(info['entries'])
-                    print(f"Found carousel/post with {entries_count} items")
-                    
-                    if entries_count == 0:
-                        # This might be a single image - try downloading directly
-                        print("No items found, trying direct download...")
-                        info = ydl.extract_info(url, download=True)
-                    else:
-                        # Download the first item
-                        first_entry = info['entries'][0]
-                        if 'url' in first_entry:
-                            item_url = first_entry['url']
-                        else:
-                            # Try to get the URL from the entry
-                            item_url = first_entry.get('webpage_url', url)
-                        info = ydl.extract_info(item_url, download=True)
-                else:
-                    # Single item - download directly
-                    info = ydl.extract_info(url, download=True)
-                
-                # Get file path
-                filename = ydl.prepare_filename(info)
-                
-                # Check if file exists
-                if not os.path.exists(filename):
-                    # Try to find any file in temp
-                    for file in os.listdir('temp'):
-                        if file.endswith(('.mp4', '.mkv', '.webm', '.jpg', '.jpeg', '.png', '.gif')):
-                            filename = os.path.join('temp', file)
-                            break
-                
-                # Read file
-                with open(filename, 'rb') as f:
-                    content = f.read()
-                
-                # Determine content type
-                is_video = filename.endswith(('.mp4', '.mkv', '.webm'))
-                is_image = filename.endswith(('.jpg', '.jpeg', '.png', '.gif'))
-                
-                # Clean up
-                try:
-                    os.remove(filename)
-                except:
-                    pass
-                
-                # Get caption if available
-                caption = info.get('title', '')
-                if info.get('description'):
-                    caption = info.get('description')
-                
+                with STAGE_SECONDS.time(stage='download', strategy='ytdlp', kind=content_kind(url)):
+                    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            
+            items = [o for o in outcomes if not isinstance(o, BaseException)]
+            if not items:
+                COOKIE_POOL.report(cookies_file, outcomes[0])
+                raise outcomes[0]
+            if len(items) < len(outcomes):
+                print(f"Skipped {len(outcomes) - len(items)} carousel items that failed")
+            DOWNLOADED_BYTES.inc(sum(item['filesize'] for item in items), strategy='ytdlp')
+        except BaseException:
+            # On failure or cancellation workers may still be writing;
+            # remove the workspace once they have really finished
+            cleanup_after(futures, workspace)
+            raise
+        
+        info = resolved['info']
+        return {
+            'items': items,
+            'url': info.get('webpage_url', url),
+            'title': info.get('title') or 'Instagram content',
+            'author': info.get('author', ''),
+            'workspace': workspace
+        }
+
+def build_ydl_opts(cookies_file: Optional[str]) -> Dict:
+    """yt-dlp options with cookies or account credentials"""
+    # Base options
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,  # progress goes to the status message through hooks instead
+        'extract_flat': False,
+        'max_filesize': download_limit(),  # guard for formats of unknown size
+    }
+    if ffmpeg_available():
+        # The same binary select_format() counted on for merging
+        ydl_opts['ffmpeg_location'] = shutil.which(config.FFMPEG_PATH)
+    
+    # Add cookies if available
+    if cookies_file:
+        print(f"Using cookies from {cookies_file}")
+        ydl_opts['cookiefile'] = cookies_file
+    elif config.INSTAGRAM_USERNAME and config.INSTAGRAM_PASSWORD:
+        ydl_opts['username'] = config.INSTAGRAM_USERNAME
+        ydl_opts['password'] = config.INSTAGRAM_PASSWORD
+    
+    return ydl_opts
+
+class YDLPool:
+    """Warm YoutubeDL instances shared by the worker threads
+    
+    Instances are kept per cookie file, so each keeps its parsed cookie jar
+    and HTTP connections between requests for the same account. An account's
+    instances are rebuilt when its cookie file changes on disk.
+    """
+    
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle: Dict[Optional[str], List['yt_dlp.YoutubeDL']] = defaultdict(list)
+        self._versions: Dict[Optional[str], Optional[int]] = {}
+    
+    @staticmethod
+    def _cookie_version(cookies_file: Optional[str]) -> Optional[int]:
+        if not cookies_file:
+            return None
+        try:
+            return os.stat(cookies_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _close(ydl: 'yt_dlp.YoutubeDL'):
+        # The jar is read-only on disk; saving it back would bump the mtime
+        ydl.params['cookiefile'] = None
+        ydl.close()
+    
+    def _create(self, cookies_file: Optional[str]) -> 'yt_dlp.YoutubeDL':
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(build_ydl_opts(cookies_file))
+        ydl.cookiejar  # parse the cookie file now, once
+        # Hooks can't be removed from an instance, so one permanent hook
+        # forwards to whichever job currently holds it
+        ydl.job_progress_hook = None
+        ydl.add_progress_hook(lambda d: ydl.job_progress_hook and ydl.job_progress_hook(d))
+        return ydl
+    
+    @contextmanager
+    def acquire(self, cookies_file: Optional[str] = None, outtmpl: Optional[str] = None,
+                format_spec: Optional[str] = None, progress_hook: Optional[Callable] = None):
+        """Borrow an instance for one account, configured for one job"""
+        version = self._cookie_version(cookies_file)
+        stale = []
+        with self._lock:
+            if cookies_file not in self._versions or self._versions[cookies_file] != version:
+                stale = self._idle.pop(cookies_file, [])
+                self._versions[cookies_file] = version
+            idle = self._idle[cookies_file]
+            ydl = idle.pop() if idle else None
+        for old in stale:
+            self._close(old)
+        if ydl is None:
+            ydl = self._create(cookies_file)
+        
+        if outtmpl:
+            ydl.params['outtmpl']['default'] = outtmpl
+        ydl.format_selector = ydl.build_format_selector(format_spec) if format_spec else None
+        ydl.job_progress_hook = progress_hook
+        try:
+            yield ydl
+        finally:
+            ydl.job_progress_hook = None
+            with self._lock:
+                idle = self._idle[cookies_file]
+                keep = self._versions.get(cookies_file) == version and len(idle) < self.size
+                if keep:
+                    idle.append(ydl)
+            if not keep:
+                self._close(ydl)
+
+YDL_POOL = YDLPool(config.DOWNLOAD_WORKERS)
+
+class ProgressHook:
+    """yt-dlp progress hook that hands byte counts to a callback in the event loop"""
+    
+    INTERVAL = 0.5  # seconds; yt-dlp calls hooks for every block
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, progress: Callable, item: int):
+        self.loop = loop
+        self.progress = progress
+        self.item = item
+        self._next = 0.0
+    
+    def __call__(self, d: Dict):
+        finished = d.get('status') == 'finished'
+        if d.get('status') != 'downloading' and not finished:
+            return
+        now = time.monotonic()
+        if now < self._next and not finished:
+            return
+        self._next = now + self.INTERVAL
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes') or 0
+        self.loop.call_soon_threadsafe(self.progress, self.item, downloaded, total and int(total))
+
+def ytdlp_prewarm(cookies_file: Optional[str] = None):
+    """Import yt-dlp and park a ready instance for this account in the pool"""
+    with YDL_POOL.acquire(cookies_file):
+        pass
+
+def explain_error(url: str, error: Exception) -> Exception:
+    """Turn a yt-dlp error into a message the bot can show to the user"""
+    if isinstance(error, (MediaTooLargeError, DownloadError)):
+        return error
+    error_msg = str(error)
+    original = f"{type(error).__name__} {error_msg}"
+    if "two-factor" in error_msg.lower():
+        return DownloadError("2FA required - please use cookies file instead", original)
+    elif classify_error(error) == 'rate_limit':
+        return DownloadError("Instagram rate limit reached - please try again in a few minutes.", original)
+    elif "login" in error_msg.lower() or "log in" in error_msg.lower():
+        if content_kind(url) == 'story':
+            return DownloadError(
+                "This story requires login. Make sure you follow this account and the story is still active.",
+                original
+            )
+        else:
+            return DownloadError("Login required - cookies may be expired. Please refresh your cookies.", original)
+    elif error_msg.startswith("Download failed"):
+        return error
+    return DownloadError(f"Download failed: {error_msg}", original)
+
+def ytdlp_resolve(url: str, cookies_file: Optional[str] = None) -> Dict:
+    """Resolve metadata once - returns the post info and the items to download"""
+    with YDL_POOL.acquire(cookies_file) as ydl:
+        try:
+            # Format selection and download later reuse this info
+            info = ydl.extract_info(url, download=False, process=False)
+        except Exception as e:
+            raise explain_error(url, e)
+    
+    targets = [info]
+    # Check if it's a playlist (carousel)
+    if info.get('_type') in ('playlist', 'multi_video'):
+        targets = list(info.get('entries') or [])
+        print(f"Found carousel/post with {len(targets)} items")
+        if not targets:
+            raise Exception("No media found in this post")
+        # Telegram albums hold at most 10 items
+        targets = targets[:config.MAX_ALBUM_ITEMS]
+    
+    # Get caption if available
+    caption = info.get('description') or info.get('title', '')
+    return {
+        'info': {
+            'webpage_url': info.get('webpage_url', url),
+            'title': caption,
+            'author': info.get('uploader', info.get('channel', ''))
+        },
+        'targets': targets
+    }
+
+def ytdlp_download_item(url: str, target: Dict, workspace: str, index: int,
+                        cookies_file: Optional[str] = None, progress_hook: Optional[Callable] = None) -> Dict:
+    """Download one already resolved item into the request's workspace"""
+    outtmpl = os.path.join(workspace, f'{index:02d}-%(id)s.%(ext)s')
+    
+    # Pick a format under the Telegram limit before fetching any bytes
+    format_spec = select_format(target)
+    
+    with YDL_POOL.acquire(cookies_file, outtmpl, format_spec, progress_hook) as ydl:
+        try:
+            info = ydl.process_ie_result(target, download=True)
+            filename = downloaded_path(ydl, info)
+        except Exception as e:
+            if "format" not in str(e).lower():
+                raise explain_error(url, e)
+            # Try a simpler format on the already resolved info
+            try:
+                print("Trying with simpler format...")
+                with YDL_POOL.acquire(cookies_file, outtmpl, 'best', progress_hook) as fallback_ydl:
+                    info = fallback_ydl.process_ie_result(target, download=True)
+                    filename = downloaded_path(fallback_ydl, info)
+            except Exception:
+                raise explain_error(url, e)
+    
+    # Determine content type
+    is_video = filename.endswith(('.mp4', '.mkv', '.webm'))
+    is_image = filename.endswith(('.jpg', '.jpeg', '.png', '.gif'))
+    
+    # File stays on disk; the caller streams it and then cleans up
+    return {
+        'filepath': filename,
+        'filesize': os.path.getsize(filename),
+        'is_video': is_video,
+        'is_image': is_image,
+        'ext': 'mp4' if is_video else 'jpg'
+    }
+
+class DirectMediaStrategy:
+    """Fetch resolved CDN media URLs with a pooled aiohttp session
+    
+    Metadata comes from the yt-dlp resolver; only the bytes are downloaded
+    here. Posts that need a yt-dlp download (merged DASH streams, HLS, ...)
+    are left to the next strategy.
+    """
+    
+    VIDEO_EXTS = ('mp4', 'mkv', 'webm', 'mov')
+    
+    def __init__(self, resolver: YTDLPStrategy):
+        self.resolver = resolver
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.DIRECT_MAX_CONNECTIONS,
+                limit_per_host=config.DIRECT_PER_HOST_LIMIT,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30)
+            )
+        return self._session
+    
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    @classmethod
+    def pick_format(cls, target: Dict) -> Dict:
+        """Best single-file HTTP format of a resolved item that fits under MAX_FILE_SIZE
+        
+        If none fits and no merged format does either, the smallest one
+        when transcoding is on, to be shrunk.
+        """
+        if target.get('_type') in ('url', 'url_transparent'):
+            # An unresolved link (e.g. a redirect), not media; yt-dlp follows it
+            raise Exception("No direct media URL")
+        if not target.get('formats'):
+            if not target.get('url'):
+                raise Exception("No direct media URL")
+            size = format_size(target)
+            if size and size > download_limit():
+                raise MediaTooLargeError(size)
+            return target
+        
+        if not fits(target, progressive_only=True) and fits(target, progressive_only=not ffmpeg_available()):
+            # No single file fits but a stream pair yt-dlp can merge does:
+            # let it have the post instead of calling it too large (or shrinking)
+            raise Exception("Only merged formats fit; left to yt-dlp")
+        
+        for _, _, parts in download_choices(target, progressive_only=True):
+            fmt = parts[0]
+            if (fmt.get('url', '').startswith(('http://', 'https://'))
+                    and fmt.get('protocol', 'https') in ('http', 'https')):
+                return fmt
+        raise Exception("No direct media URL")
+    
+    async def download(self, url: str, progress: Optional[Callable] = None) -> Dict:
+        """Download every resolved item straight from the CDN"""
+        resolved = await self.resolver.resolve(url)
+        entries = []
+        for index, target in enumerate(resolved['targets']):
+            fmt = self.pick_format(target)
+            entries.append({
+                'url': fmt['url'],
+                'id': target.get('id', index),
+                'ext': fmt.get('ext') or target.get('ext') or 'mp4',
+                'headers': fmt.get('http_headers') or target.get('http_headers') or {}
+            })
+        
+        with STAGE_SECONDS.time(stage='download', strategy='direct', kind=content_kind(url)):
+            fetched = await self.fetch_all(entries, progress)
+        DOWNLOADED_BYTES.inc(sum(item['filesize'] for item in fetched['items']), strategy='direct')
+        info = resolved['info']
+        return {
+            'items': fetched['items'],
+            'url': info.get('webpage_url', url),
+            'title': info.get('title') or 'Instagram content',
+            'author': info.get('author', ''),
+            'workspace': fetched['workspace']
+        }
+    
+    async def fetch_all(self, entries: List[Dict], progress: Optional[Callable] = None) -> Dict:
+        """Download {'url', 'id', 'ext', 'headers'} entries into a new workspace"""
+        workspace = create_workspace()
+        try:
+            fanout = asyncio.Semaphore(config.ALBUM_FANOUT)
+            
+            async def fetch(index: int, entry: Dict) -> Dict:
+                ext = entry['ext']
+                path = os.path.join(workspace, f"{index:02d}-{entry['id']}.{ext}")
+                report = functools.partial(progress, index) if progress else None
+                async with fanout:
+                    size = await self._fetch(entry['url'], entry.get('headers') or {}, path, report)
+                is_video = ext in self.VIDEO_EXTS
                 return {
-                    'content': content,
-                    'url': info.get('webpage_url', url),
-                    'title': caption or 'Instagram content',
-                    'author': info.get('uploader', info.get('channel', '')),
+                    'filepath': path,
+                    'filesize': size,
                     'is_video': is_video,
-                    'is_image': is_image,
-                    'ext': 'mp4' if is_video else 'jpg'
+                    'is_image': not is_video,
+                    'ext': ext
                 }
-                
-            except Exception as e:
-                error_msg = str(e)
-                if "two-factor" in error_msg.lower():
-                    raise Exception("2FA required - please use cookies file instead")
-                elif "login" in error_msg.lower() or "log in" in error_msg.lower():
-                    if is_story:
-                        raise Exception("This story requires login. Make sure you follow this account and the story is still active.")
-                    else:
-                        raise Exception("Login required - cookies may be expired. Please refresh your cookies.")
-                elif "format" in error_msg.lower():
-                    # Try a simpler format
-                    try:
-                        print("Trying with simpler format...")
-                        ydl_opts['format'] = 'best'
-                        info = ydl.extract_info(url, download=True)
-                        filename = ydl.prepare_filename(info)
-                        with open(filename, 'rb') as f:
-                            content = f.read()
-                        os.remove(filename)
-                        is_video = filename.endswith(('.mp4', '.mkv', '.webm'))
-                        return {
-                            'content': content,
-                            'url': info.get('webpage_url', url),
-                            'title': info.get('title', ''),
-                            'author': info.get('uploader', ''),
-                            'is_video': is_video,
-                            'is_image': not is_video,
-                            'ext': 'mp4' if is_video else 'jpg'
-                        }
-                    except:
-                        raise Exception(f"Download failed: {error_msg}")
-                else:
-                    raise Exception(f"Download failed: {error_msg}")
\ No newline at end of file
+            
+            items = await gather_or_cancel(fetch(i, e) for i, e in enumerate(entries))
+        except BaseException:
+            remove_workspace(workspace)
+            raise
+        return {'items': list(items), 'workspace': workspace}
+    
+    async def _fetch(self, url: str, headers: Dict, path: str, progress: Optional[Callable] = None) -> int:
+        """Stream one file to disk, splitting large files into parallel Range requests
+        
+        progress(downloaded, total) is called as chunks arrive.
+        """
+        session = self._get_session()
+        segment = config.DIRECT_SEGMENT_SIZE
+        received = 0
+        
+        def count(size: int):
+            nonlocal received
+            received += size
+            if progress:
+                progress(received, total)
+        
+        # Ask for the first segment only; a 206 tells us the total size
+        async with session.get(url, headers={**headers, 'Range': f'bytes=0-{segment - 1}'}) as resp:
+            resp.raise_for_status()
+            if not resp.content_type.startswith(('video/', 'image/')):
+                # A web page or error document served in place of the media
+                raise Exception(f"Not a media file ({resp.content_type})")
+            total = None
+            # A 200 means the server ignored Range and is sending the whole file
+            segmented = resp.status == 206
+            if segmented:
+                content_range = resp.headers.get('Content-Range', '')
+                if '/' in content_range and not content_range.endswith('*'):
+                    total = int(content_range.rsplit('/', 1)[1])
+            elif resp.content_length:
+                total = resp.content_length
+            if total and total > download_limit():
+                # Stop before fetching the rest
+                raise MediaTooLargeError(total)
+            with open(path, 'wb') as f:
+                await self._write_body(resp, f, count)
+                if segmented and total and total > segment:
+                    f.truncate(total)
+        
+        if segmented and total and total > segment:
+            limit = asyncio.Semaphore(config.DIRECT_SEGMENTS)
+            
+            async def fetch_range(start: int, end: int):
+                async with limit:
+                    await self._fetch_range(url, headers, path, start, end, count)
+            
+            await gather_or_cancel(
+                fetch_range(start, min(start + segment, total) - 1)
+                for start in range(segment, total, segment)
+            )
+        return os.path.getsize(path)
+    
+    async def _fetch_range(self, url: str, headers: Dict, path: str, start: int, end: int,
+                           count: Callable[[int], None]):
+        """Write bytes start..end of the file at their offset"""
+        range_headers = {**headers, 'Range': f'bytes={start}-{end}'}
+        async with self._get_session().get(url, headers=range_headers) as resp:
+            resp.raise_for_status()
+            if resp.status != 206:
+                raise Exception("Server ignored Range request")
+            with open(path, 'r+b') as f:
+                f.seek(start)
+                await self._write_body(resp, f, count)
+    
+    @staticmethod
+    async def _write_body(resp: aiohttp.ClientResponse, f, count: Callable[[int], None]):
+        async for chunk in resp.content.iter_chunked(64 * 1024):
+            f.write(chunk)
+            count(len(chunk))
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import config
+
+_executor: Optional[Executor] = None
+_transcode_executor: Optional[Executor] = None
+
+def _broken(executor: Optional[Executor]) -> bool:
+    return isinstance(executor, ProcessPoolExecutor) and bool(executor._broken)
+
+def get_executor() -> Executor:
+    """Shared worker pool that runs blocking yt-dlp calls off the event loop"""
+    global _executor
+    if _broken(_executor):
+        # A worker process died; the old pool rejects every job from now on
+        _executor.shutdown(wait=False)
+        _executor = None
+    if _executor is None:
+        if config.DOWNLOAD_EXECUTOR == 'process':
+            _executor = ProcessPoolExecutor(max_workers=config.DOWNLOAD_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=config.DOWNLOAD_WORKERS,
+                thread_name_prefix='ytdlp'
+            )
+    return _executor
+
+def get_transcode_executor() -> Executor:
+    """Process pool for ffmpeg work, kept apart from the network-bound download pool"""
+    global _transcode_executor
+    if _broken(_transcode_executor):
+        _transcode_executor.shutdown(wait=False)
+        _transcode_executor = None
+    if _transcode_executor is None:
+        _transcode_executor = ProcessPoolExecutor(max_workers=config.TRANSCODE_WORKERS)
+    return _transcode_executor
+
+def shutdown_executor():
+    """Stop the worker pools (waits for running downloads)"""
+    global _executor, _transcode_executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _transcode_executor is not None:
+        _transcode_executor.shutdown(wait=True)
+        _transcode_executor = None
+
+def create_workspace() -> str:
+    """Create a private scratch directory for one request"""
+    os.makedirs(config.WORKSPACE_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix='dl-', dir=config.WORKSPACE_DIR)
+
+def remove_workspace(workspace: Optional[str]):
+    """Delete a request's scratch directory and everything in it"""
+    if workspace:
+        shutil.rmtree(workspace, ignore_errors=True)
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import config
+from core.extractors.unified import UnifiedExtractor
+from core.extractors.workers import remove_workspace
+
+logger = logging.getLogger(__name__)
+
+JOBS_QUEUE = 'downloads'
+
+class SQLiteJobQueue:
+    """Job queue in a SQLite file, shared by processes on one machine
+    
+    get() leases a job for visibility_timeout seconds; a job that isn't
+    acked before its lease runs out is handed out again (at-least-once).
+    """
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, queue TEXT NOT NULL, payload TEXT NOT NULL, '
+            'visible_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, owner TEXT)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (queue, visible_at)')
+    
+    def _put(self, queue: str, job_id: str, payload: str):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO jobs (id, queue, payload, visible_at) VALUES (?, ?, ?, ?)',
+                (job_id, queue, payload, time.time())
+            )
+    
+    def _get(self, queue: str, owner: str, visibility_timeout: float) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock, so two processes can't lease the same job
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute(
+                    'SELECT id, payload, attempts FROM jobs WHERE queue = ? AND visible_at <= ? '
+                    'ORDER BY visible_at LIMIT 1',
+                    (queue, now)
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        'UPDATE jobs SET visible_at = ?, attempts = attempts + 1, owner = ? WHERE id = ?',
+                        (now + visibility_timeout, owner, row[0])
+                    )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        if not row:
+            return None
+        return {'id': row[0], 'payload': json.loads(row[1]), 'attempts': row[2] + 1}
+    
+    def _touch(self, queue: str, job_id: str, visibility_timeout: float):
+        with self._lock:
+            self._db.execute(
+                'UPDATE jobs SET visible_at = ? WHERE id = ? AND queue = ?',
+                (time.time() + visibility_timeout, job_id, queue)
+            )
+    
+    def _ack(self, queue: str, job_id: str):
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE id = ? AND queue = ?', (job_id, queue))
+    
+    def _depth(self, queue: str) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM jobs WHERE queue = ?', (queue,)).fetchone()[0]
+    
+    async def put(self, queue: str, job_id: str, payload: Dict):
+        await asyncio.to_thread(self._put, queue, job_id, json.dumps(payload))
+    
+    async def get(self, queue: str, owner: str, visibility_timeout: float) -> Optional[Dict]:
+        return await asyncio.to_thread(self._get, queue, owner, visibility_timeout)
+    
+    async def touch(self, queue: str, job_id: str, visibility_timeout: float):
+        await asyncio.to_thread(self._touch, queue, job_id, visibility_timeout)
+    
+    async def ack(self, queue: str, job_id: str):
+        await asyncio.to_thread(self._ack, queue, job_id)
+    
+    async def depth(self, queue: str) -> int:
+        return await asyncio.to_thread(self._depth, queue)
+    
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+class RedisJobQueue:
+    """Job queue in Redis for workers spread over several machines
+    
+    Ready job ids sit in a list; leased ids move to a sorted set scored by
+    lease deadline and go back to the list once the deadline passes.
+    """
+    
+    # Requeue expired leases, then lease the oldest ready job
+    _GET = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for _, id in ipairs(expired) do
+        redis.call('ZREM', KEYS[2], id)
+        redis.call('RPUSH', KEYS[1], id)
+    end
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then return nil end
+    redis.call('ZADD', KEYS[2], ARGV[2], id)
+    local attempts = redis.call('HINCRBY', KEYS[4], id, 1)
+    return {id, redis.call('HGET', KEYS[3], id), attempts}
+    """
+    
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # optional dependency
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._get_script = self._redis.register_script(self._GET)
+    
+    @staticmethod
+    def _keys(queue: str):
+        base = f'jobs:{queue}'
+        return [f'{base}:ready', f'{base}:leased', f'{base}:data', f'{base}:attempts']
+    
+    async def put(self, queue: str, job_id: str, payload: Dict):
+        ready, _, data, _ = self._keys(queue)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(data, job_id, json.dumps(payload))
+            pipe.rpush(ready, job_id)
+            await pipe.execute()
+    
+    async def get(self, queue: str, owner: str, visibility_timeout: float) -> Optional[Dict]:
+        now = time.time()
+        row = await self._get_script(keys=self._keys(queue), args=[now, now + visibility_timeout])
+        if not row:
+            return None
+        job_id, payload, attempts = row
+        if payload is None:
+            # Acked by someone else in the meantime
+            await self.ack(queue, job_id)
+            return None
+        return {'id': job_id, 'payload': json.loads(payload), 'attempts': int(attempts)}
+    
+    async def touch(self, queue: str, job_id: str, visibility_timeout: float):
+        _, leased, _, _ = self._keys(queue)
+        await self._redis.zadd(leased, {job_id: time.time() + visibility_timeout}, xx=True)
+    
+    async def ack(self, queue: str, job_id: str):
+        _, leased, data, attempts = self._keys(queue)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(leased, job_id)
+            pipe.hdel(data, job_id)
+            pipe.hdel(attempts, job_id)
+            await pipe.execute()
+    
+    async def depth(self, queue: str) -> int:
+        return await self._redis.hlen(self._keys(queue)[2])
+    
+    async def close(self):
+        await self._redis.aclose()
+
+def create_job_queue():
+    """Build the queue configured by JOB_QUEUE_BACKEND ('sqlite' or 'redis')"""
+    if config.JOB_QUEUE_BACKEND == 'redis':
+        return RedisJobQueue(config.REDIS_URL)
+    return SQLiteJobQueue(str(config.CACHE_DIR / 'jobs.sqlite3'))
+
+def node_name() -> str:
+    return config.NODE_ID or 'frontend'
+
+class RemoteExtractor(UnifiedExtractor):
+    """UnifiedExtractor whose extractions run on download workers
+    
+    Jobs go to the shared queue and workers send results back to this
+    node's result queue. Workspaces must be on storage this process can
+    read (same machine, or a shared WORKSPACE_DIR across nodes).
+    """
+    
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+        self.results_queue = f'results:{node_name()}'
+        self._waiting: Dict[str, asyncio.Future] = {}
+        self._poller: Optional[asyncio.Task] = None
+    
+    async def prewarm(self):
+        # Nothing to load here - the workers download
+        pass
+    
+    async def extract_once(self, url: str, progress: Optional[Callable] = None) -> Dict[str, Any]:
+        """Hand the URL to a worker and wait for its result (no progress from workers)"""
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll_results())
+        
+        job_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[job_id] = future
+        try:
+            await self.queue.put(JOBS_QUEUE, job_id, {'url': url, 'reply_to': self.results_queue})
+            return await asyncio.wait_for(future, timeout=config.JOB_RESULT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return {'success': False, 'error': 'Timed out waiting for a download worker'}
+        finally:
+            self._waiting.pop(job_id, None)
+    
+    async def _poll_results(self):
+        while True:
+            try:
+                message = await self.queue.get(self.results_queue, node_name(), config.JOB_VISIBILITY_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Result queue error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                await asyncio.sleep(config.JOB_POLL_INTERVAL)
+                continue
+            
+            payload = message['payload']
+            result = payload['result']
+            future = self._waiting.get(payload['job_id'])
+            if future and not future.done():
+                future.set_result(result)
+            elif result.get('success'):
+                # Duplicate delivery or nobody waiting any more
+                remove_workspace(result['data'].get('workspace'))
+            await self.queue.ack(self.results_queue, message['id'])
+    
+    async def close(self):
+        if self._poller:
+            self._poller.cancel()
+            self._poller = None
+        await self.queue.close()
+        await super().close()
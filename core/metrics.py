@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    kind = 'untyped'
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, '')) for n in self.label_names)
+    
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+class Counter(_Metric):
+    kind = 'counter'
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f'{self.name}{_labels_text(self.label_names, k)} {v}' for k, v in values]
+
+class Gauge(Counter):
+    kind = 'gauge'
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+    
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    @contextmanager
+    def track(self, **labels):
+        """Count something as in progress for the duration of the block"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class CallbackGauge(_Metric):
+    """Gauge whose value is read from a function at scrape time"""
+    kind = 'gauge'
+    
+    def __init__(self, name: str, help_text: str, func: Callable[[], float]):
+        super().__init__(name, help_text)
+        self.func = func
+    
+    def render(self) -> List[str]:
+        return self.header() + [f'{self.name} {self.func()}']
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # key -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+    
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            values = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, count) in values:
+            for bound, n in zip(self.buckets, counts):
+                le = _labels_text(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{le} {n}')
+            le = _labels_text(self.label_names, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {count}')
+            lines.append(f'{self.name}_sum{_labels_text(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_labels_text(self.label_names, key)} {count}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'bot_stage_seconds', 'Time spent per request stage',
+    ('stage', 'strategy', 'kind')
+))
+REQUESTS = REGISTRY.register(Counter(
+    'bot_requests_total', 'Download requests by outcome', ('outcome',)
+))
+DOWNLOADS_INFLIGHT = REGISTRY.register(Gauge(
+    'bot_downloads_inflight', 'Strategy downloads currently running', ('strategy',)
+))
+UPLOADS_INFLIGHT = REGISTRY.register(Gauge(
+    'bot_uploads_inflight', 'Telegram uploads currently running'
+))
+DOWNLOADED_BYTES = REGISTRY.register(Counter(
+    'bot_downloaded_bytes_total', 'Media bytes downloaded', ('strategy',)
+))
+UPLOADED_BYTES = REGISTRY.register(Counter(
+    'bot_uploaded_bytes_total', 'Media bytes uploaded to Telegram'
+))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    'bot_startup_seconds', 'Seconds from bot start until each startup phase finished', ('phase',)
+))
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics (Prometheus text) and /stats (JSON snapshot)"""
+    
+    def __init__(self, host: str, port: int, registry: Registry = REGISTRY,
+                 snapshot: Optional[Callable[[], Dict]] = None):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.snapshot = snapshot
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+    
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot() if self.snapshot else {})
+    
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        app.router.add_get('/stats', self._stats)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
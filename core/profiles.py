@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from datetime import timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import config
+from core.cookies import COOKIE_POOL
+from core.extractors.instaloader_strategy import instaloader_profile_posts
+
+logger = logging.getLogger(__name__)
+
+class ProfileIndex:
+    """Followed accounts, their subscribed chats and the newest synced post (SQLite)"""
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS subscriptions ('
+            'username TEXT NOT NULL, chat_id INTEGER NOT NULL, '
+            'PRIMARY KEY (username, chat_id))'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS subscriptions_chat ON subscriptions (chat_id)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS profiles ('
+            'username TEXT PRIMARY KEY, newest_shortcode TEXT, '
+            'newest_at REAL NOT NULL DEFAULT 0, checked_at REAL)'
+        )
+        self._db.commit()
+    
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+    
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        with self._lock:
+            changed = self._db.execute(sql, params).rowcount
+            self._db.commit()
+            return changed
+    
+    async def follow(self, username: str, chat_id: int) -> bool:
+        """Subscribe a chat; False if it already was"""
+        return await asyncio.to_thread(
+            self._write, 'INSERT OR IGNORE INTO subscriptions (username, chat_id) VALUES (?, ?)',
+            (username, chat_id)
+        ) > 0
+    
+    async def unfollow(self, username: str, chat_id: int) -> bool:
+        removed = await asyncio.to_thread(
+            self._write, 'DELETE FROM subscriptions WHERE username = ? AND chat_id = ?', (username, chat_id)
+        ) > 0
+        # Nobody left - forget the sync position so a new follower starts fresh
+        await asyncio.to_thread(
+            self._write,
+            'DELETE FROM profiles WHERE username = ? AND NOT EXISTS '
+            '(SELECT 1 FROM subscriptions WHERE username = ?)',
+            (username, username)
+        )
+        return removed
+    
+    async def following(self, chat_id: int) -> List[str]:
+        rows = await asyncio.to_thread(
+            self._query, 'SELECT username FROM subscriptions WHERE chat_id = ? ORDER BY username', (chat_id,)
+        )
+        return [row[0] for row in rows]
+    
+    async def subscribers(self, username: str) -> List[int]:
+        rows = await asyncio.to_thread(
+            self._query, 'SELECT chat_id FROM subscriptions WHERE username = ?', (username,)
+        )
+        return [row[0] for row in rows]
+    
+    async def usernames(self) -> List[str]:
+        """Accounts with at least one subscriber, least recently checked first"""
+        rows = await asyncio.to_thread(
+            self._query,
+            'SELECT DISTINCT s.username FROM subscriptions s LEFT JOIN profiles p USING (username) '
+            'ORDER BY COALESCE(p.checked_at, 0)'
+        )
+        return [row[0] for row in rows]
+    
+    async def newest(self, username: str) -> Optional[Tuple[str, float]]:
+        """(shortcode, timestamp) of the newest post already synced"""
+        rows = await asyncio.to_thread(
+            self._query,
+            'SELECT newest_shortcode, newest_at FROM profiles WHERE username = ? AND newest_shortcode IS NOT NULL',
+            (username,)
+        )
+        return rows[0] if rows else None
+    
+    async def advance(self, username: str, shortcode: Optional[str], timestamp: float):
+        """Record a post as synced; the position only moves forward"""
+        await asyncio.to_thread(
+            self._write,
+            'INSERT INTO profiles (username, newest_shortcode, newest_at, checked_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (username) DO UPDATE SET checked_at = excluded.checked_at, '
+            'newest_shortcode = CASE WHEN excluded.newest_at > newest_at '
+            'THEN excluded.newest_shortcode ELSE newest_shortcode END, '
+            'newest_at = MAX(newest_at, excluded.newest_at)',
+            (username, shortcode, timestamp, time.time())
+        )
+    
+    async def close(self):
+        await asyncio.to_thread(self._db.close)
+
+async def new_posts(username: str, newest: Optional[Tuple[str, float]], executor,
+                    cookies_file: Optional[str] = None) -> AsyncIterator[Dict]:
+    """Posts newer than the last synced one, newest first
+    
+    Profile pages are requested only as the generator is consumed, and it
+    ends at the first already synced post, so a sync costs O(new posts).
+    Without a sync position every post is yielded; the caller decides
+    when to stop.
+    """
+    loop = asyncio.get_running_loop()
+    known_shortcode, known_at = newest or (None, 0.0)
+    posts = await loop.run_in_executor(executor, instaloader_profile_posts, username, cookies_file)
+    while True:
+        post = await loop.run_in_executor(executor, next, posts, None)
+        if post is None:
+            return
+        timestamp = post.date_utc.replace(tzinfo=timezone.utc).timestamp()
+        entry = {
+            'shortcode': post.shortcode,
+            'url': f'https://www.instagram.com/p/{post.shortcode}/',
+            'timestamp': timestamp,
+            'pinned': post.is_pinned
+        }
+        if post.is_pinned:
+            # Pinned posts come first whatever their age
+            if post.shortcode != known_shortcode and timestamp > known_at:
+                yield entry
+            continue
+        if post.shortcode == known_shortcode or timestamp <= known_at:
+            return
+        yield entry
+
+class ProfileSync:
+    """Periodically pushes new posts of followed accounts to their chats
+    
+    `deliver(chat_ids, url)` downloads one post and sends it; it returns
+    False if the post can't be delivered (it's skipped) and raises
+    SchedulerBusy to retry it on the next round.
+    """
+    
+    def __init__(self, index: ProfileIndex, deliver: Callable[[List[int], str], Awaitable[bool]]):
+        self.index = index
+        self.deliver = deliver
+        # Instaloader's session isn't thread-safe: page through profiles on one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='profile-sync')
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if config.PROFILE_SYNC_INTERVAL > 0:
+            self._task = asyncio.ensure_future(self._run())
+    
+    async def _run(self):
+        while True:
+            for username in await self.index.usernames():
+                try:
+                    sent = await self.sync(username)
+                    if sent:
+                        logger.info(f"Synced {sent} new posts from @{username}")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Sync of @{username} failed: {e}")
+            await asyncio.sleep(config.PROFILE_SYNC_INTERVAL)
+    
+    async def _fetch_new(self, username: str, newest: Optional[Tuple[str, float]]) -> List[Dict]:
+        cookies_file = COOKIE_POOL.acquire()
+        posts = []
+        try:
+            async with aclosing(new_posts(username, newest, self._executor, cookies_file)) as stream:
+                async for post in stream:
+                    posts.append(post)
+                    if newest is None and not post['pinned']:
+                        break  # first sync: only find where the account is now
+                    if len(posts) >= config.PROFILE_SYNC_MAX_POSTS:
+                        break
+        except Exception as e:
+            COOKIE_POOL.report(cookies_file, e)
+            raise
+        COOKIE_POOL.report(cookies_file)
+        return posts
+    
+    async def sync(self, username: str) -> int:
+        """Send an account's posts published since the last sync; returns how many"""
+        newest = await self.index.newest(username)
+        posts = await self._fetch_new(username, newest)
+        
+        if newest is None:
+            # No backfill - new followers get posts published from now on
+            latest = max(posts, key=lambda p: p['timestamp'], default=None)
+            await self.index.advance(username, latest and latest['shortcode'], latest['timestamp'] if latest else 0)
+            return 0
+        
+        sent = 0
+        for post in sorted(posts, key=lambda p: p['timestamp']):
+            chat_ids = await self.index.subscribers(username)
+            if not chat_ids:
+                break
+            if await self.deliver(chat_ids, post['url']):
+                sent += 1
+            await self.index.advance(username, post['shortcode'], post['timestamp'])
+        if not posts:
+            await self.index.advance(username, None, 0)
+        return sent
+    
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        await asyncio.to_thread(self._executor.shutdown)
+        await self.index.close()
+
+def create_profile_index() -> ProfileIndex:
+    return ProfileIndex(str(config.CACHE_DIR / 'profiles.sqlite3'))
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from telegram import Message
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Earliest time each chat's status messages may be edited again
+_next_edit: Dict[int, float] = {}
+
+def _reserve(chat_id: int) -> float:
+    """Claim the chat's next edit slot; returns how long to wait for it"""
+    now = time.monotonic()
+    at = max(now, _next_edit.get(chat_id, 0.0))
+    _next_edit[chat_id] = at + config.PROGRESS_EDIT_INTERVAL
+    if len(_next_edit) > 10000:
+        for stale in [chat for chat, t in _next_edit.items() if t < now]:
+            del _next_edit[stale]
+    return at - now
+
+def _mb(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f} MB"
+
+class ProgressReporter:
+    """Download progress shown in a request's status message
+    
+    Passed to extract() as its progress callback; nothing is shown until
+    the status message is attached. Edits are coalesced to at most one per
+    PROGRESS_EDIT_INTERVAL seconds per chat, always with the latest
+    numbers, so downloads faster than that cause no edit at all.
+    """
+    
+    def __init__(self):
+        self.status_msg: Optional[Message] = None
+        self._items: Dict[int, Tuple[int, Optional[int]]] = {}
+        self._shown: Optional[str] = None
+        self._pending: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    def attach(self, status_msg: Message):
+        """Start showing progress in status_msg"""
+        self.status_msg = status_msg
+        self._shown = status_msg.text
+        # Sending the status message counts as the chat's last edit
+        _next_edit[status_msg.chat_id] = max(
+            _next_edit.get(status_msg.chat_id, 0.0), time.monotonic() + config.PROGRESS_EDIT_INTERVAL
+        )
+        if self._items:
+            self._schedule()
+    
+    def __call__(self, item: int, downloaded: int, total: Optional[int]):
+        self._items[item] = (downloaded, total)
+        self._schedule()
+    
+    def _schedule(self):
+        if self._closed or self.status_msg is None or config.PROGRESS_EDIT_INTERVAL <= 0:
+            return
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._edit())
+    
+    def text(self) -> str:
+        downloaded = sum(done for done, _ in self._items.values())
+        totals = [total for _, total in self._items.values()]
+        label = f"Downloading {len(totals)} items" if len(totals) > 1 else "Downloading"
+        if all(totals):
+            total = sum(totals)
+            return f"{label}... {min(100, downloaded * 100 // total)}% ({_mb(downloaded)} of {_mb(total)})"
+        return f"{label}... {_mb(downloaded)}"
+    
+    async def _edit(self):
+        try:
+            await asyncio.sleep(_reserve(self.status_msg.chat_id))
+            text = self.text()
+            if text != self._shown:
+                self._shown = text
+                await self.status_msg.edit_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Progress is cosmetic; the request carries on
+            logger.debug(f"Progress update failed: {e}")
+        finally:
+            self._pending = None
+    
+    def close(self):
+        """Stop editing; call before the status message is reused or deleted"""
+        self._closed = True
+        if self._pending:
+            self._pending.cancel()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class SchedulerBusy(Exception):
+    """Raised when a job can't be admitted; carries the current queue depth"""
+    
+    def __init__(self, message: str, depth: int):
+        super().__init__(message)
+        self.depth = depth
+
+class Job:
+    """A queued unit of work for one user"""
+    
+    def __init__(self, user_id: int, func: Callable[[], Awaitable[Any]],
+                 on_discard: Optional[Callable[[Any], None]] = None):
+        self.user_id = user_id
+        self.func = func
+        self.on_discard = on_discard
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.position = 0
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+    
+    def __await__(self):
+        return self.future.__await__()
+
+class FairScheduler:
+    """Bounded job queue dispatched round-robin across users
+    
+    Each user has a cap on running and on queued jobs, and the whole queue
+    has a global cap; submit() raises SchedulerBusy instead of queueing
+    beyond those limits.
+    """
+    
+    def __init__(self, workers: int, max_queue: int, user_max_inflight: int, user_max_queued: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.user_max_inflight = user_max_inflight
+        self.user_max_queued = user_max_queued
+        self._queues: 'OrderedDict[int, Deque[Job]]' = OrderedDict()
+        self._inflight: Dict[int, int] = {}
+        self._queued = 0
+        self._running = 0
+        self._rejected = 0
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+    
+    def _start(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Condition()
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+    
+    def submit(self, user_id: int, func: Callable[[], Awaitable[Any]],
+               on_discard: Optional[Callable[[Any], None]] = None) -> Job:
+        """Queue func() for user_id; await the returned Job for its result
+        
+        on_discard receives the result if the submitter stopped waiting.
+        """
+        self._start()
+        user_queue = self._queues.get(user_id)
+        if self._queued >= self.max_queue:
+            self._rejected += 1
+            raise SchedulerBusy(f"Queue full ({self._queued} waiting)", self._queued)
+        if user_queue is not None and len(user_queue) >= self.user_max_queued:
+            self._rejected += 1
+            raise SchedulerBusy(f"Too many pending requests ({len(user_queue)} waiting)", len(user_queue))
+        
+        job = Job(user_id, func, on_discard)
+        if user_queue is None:
+            user_queue = self._queues[user_id] = deque()
+        user_queue.append(job)
+        self._queued += 1
+        job.position = self._position(user_id, len(user_queue))
+        job.future.add_done_callback(lambda _: self._withdraw(job))
+        asyncio.ensure_future(self._notify())
+        return job
+    
+    def _position(self, user_id: int, index: int) -> int:
+        """Approximate place in line: each other user gets a turn per round"""
+        ahead = sum(min(len(q), index) for uid, q in self._queues.items() if uid != user_id)
+        return ahead + index
+    
+    def _withdraw(self, job: Job):
+        """Forget a job that was cancelled while still queued"""
+        if not job.future.cancelled() or job.started_at is not None:
+            return
+        user_queue = self._queues.get(job.user_id)
+        if user_queue and job in user_queue:
+            user_queue.remove(job)
+            self._queued -= 1
+            if not user_queue:
+                del self._queues[job.user_id]
+    
+    async def _notify(self):
+        async with self._wakeup:
+            self._wakeup.notify_all()
+    
+    def _pick(self) -> Optional[Job]:
+        """Next job in round-robin order from a user under their in-flight cap"""
+        for user_id, user_queue in self._queues.items():
+            if self._inflight.get(user_id, 0) >= self.user_max_inflight:
+                continue
+            job = user_queue.popleft()
+            self._queued -= 1
+            del self._queues[user_id]
+            if user_queue:
+                # Back of the line for this user's next job
+                self._queues[user_id] = user_queue
+            return job
+        return None
+    
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                job = self._pick()
+                while job is None:
+                    await self._wakeup.wait()
+                    job = self._pick()
+            
+            job.started_at = time.monotonic()
+            self._inflight[job.user_id] = self._inflight.get(job.user_id, 0) + 1
+            self._running += 1
+            # Run the job as its own task: a job that cancels itself or raises a
+            # BaseException must not take this worker down with it
+            task = asyncio.ensure_future(self._run(job))
+            try:
+                await asyncio.wait({task})
+                if task.cancelled():
+                    job.future.cancel()
+                elif task.exception() is not None:
+                    if not job.future.done():
+                        job.future.set_exception(task.exception())
+                elif job.future.done():
+                    if job.on_discard:
+                        job.on_discard(task.result())
+                else:
+                    job.future.set_result(task.result())
+            except asyncio.CancelledError:
+                # The worker itself is being stopped
+                task.cancel()
+                job.future.cancel()
+                raise
+            finally:
+                self._running -= 1
+                self._inflight[job.user_id] -= 1
+                if not self._inflight[job.user_id]:
+                    del self._inflight[job.user_id]
+                await self._notify()
+    
+    @staticmethod
+    async def _run(job: Job) -> Any:
+        return await job.func()
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._queued,
+            'running': self._running,
+            'users_waiting': len(self._queues),
+            'rejected': self._rejected
+        }
+    
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
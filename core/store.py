@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+def store_key(shortcode: str) -> str:
+    """Store key: the post plus the format it was downloaded in"""
+    # Formats are picked to fit MAX_FILE_SIZE, so a different limit is a different file
+    return f"{shortcode}:{config.MAX_FILE_SIZE // (1024 * 1024)}mb"
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class MediaStore:
+    """Content-addressed store of downloaded media under CACHE_DIR
+    
+    Files are stored once per sha256 and shared by every entry that has the
+    same bytes. Entries are evicted least recently used first once the
+    store grows past its byte budget; entries handed out by get() stay
+    until they are released. The SQLite index survives restarts.
+    """
+    
+    def __init__(self, root: Path, budget: int):
+        self.root = root
+        self.objects_dir = root / 'objects'
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._in_use: Counter = Counter()
+        self._adding: Counter = Counter()  # objects whose refs aren't written yet
+        self._db = sqlite3.connect(str(root / 'index.sqlite3'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, media TEXT NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS objects ('
+            'sha256 TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS refs ('
+            'key TEXT NOT NULL, sha256 TEXT NOT NULL, PRIMARY KEY (key, sha256))'
+        )
+        self._db.commit()
+        self._reconcile()
+    
+    def _object_path(self, sha256: str, ext: str) -> Path:
+        return self.objects_dir / sha256[:2] / f'{sha256}{ext}'
+    
+    def _reconcile(self):
+        """Forget entries whose files disappeared while we were not running"""
+        missing = [
+            sha256 for sha256, ext in self._db.execute('SELECT sha256, ext FROM objects')
+            if not self._object_path(sha256, ext).exists()
+        ]
+        if not missing:
+            return
+        logger.warning(f"Media store: {len(missing)} files missing, dropping their entries")
+        for sha256 in missing:
+            keys = [row[0] for row in self._db.execute('SELECT key FROM refs WHERE sha256 = ?', (sha256,))]
+            for key in keys:
+                self._drop_entry(key)
+            self._db.execute('DELETE FROM objects WHERE sha256 = ?', (sha256,))
+        self._db.commit()
+    
+    def _get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute('SELECT media FROM entries WHERE key = ?', (key,)).fetchone()
+            if not row:
+                return None
+            self._db.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._db.commit()
+            self._in_use[key] += 1
+        
+        media = json.loads(row[0])
+        for item in media.get('items') or [media]:
+            item['path'] = str(self._object_path(item.pop('sha256'), item.pop('ext')))
+            if 'thumbnail_sha256' in item:
+                item['thumbnail'] = str(self._object_path(item.pop('thumbnail_sha256'), item.pop('thumbnail_ext')))
+            if not os.path.exists(item['path']):
+                # Evicted from under us - download again
+                self.release(key)
+                with self._lock:
+                    self._drop_entry(key)
+                    self._db.commit()
+                return None
+        return media
+    
+    def _store_file(self, path: str) -> Dict:
+        """Add one file by content; returns its sha256 and extension
+        
+        The object is protected from eviction until _put() has written the
+        refs to it and called _added().
+        """
+        sha256 = file_sha256(path)
+        ext = os.path.splitext(path)[1]
+        size = os.path.getsize(path)
+        with self._lock:
+            self._adding[sha256] += 1
+            known = self._db.execute('SELECT ext FROM objects WHERE sha256 = ?', (sha256,)).fetchone()
+        if known:
+            return {'sha256': sha256, 'ext': known[0]}  # same bytes already stored
+        
+        target = self._object_path(sha256, ext)
+        target.parent.mkdir(exist_ok=True)
+        tmp = target.with_name(f'.{target.name}.{threading.get_ident()}')
+        try:
+            os.link(path, tmp)  # same filesystem: no copy
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR IGNORE INTO objects (sha256, ext, size) VALUES (?, ?, ?)', (sha256, ext, size)
+            )
+            self._db.commit()
+        return {'sha256': sha256, 'ext': ext}
+    
+    def _added(self, shas: List[str]):
+        """Objects from _store_file() may be evicted again (call under the lock)"""
+        for sha256 in shas:
+            self._adding[sha256] -= 1
+            if self._adding[sha256] <= 0:
+                del self._adding[sha256]
+    
+    def _put(self, key: str, media: Dict):
+        media = json.loads(json.dumps(media))  # our own copy
+        items = media.get('items') or [media]
+        shas = []
+        try:
+            for item in items:
+                item.update(self._store_file(item.pop('path')))
+                shas.append(item['sha256'])
+                thumbnail = item.pop('thumbnail', None)
+                if thumbnail:
+                    stored = self._store_file(thumbnail)
+                    item['thumbnail_sha256'], item['thumbnail_ext'] = stored['sha256'], stored['ext']
+                    shas.append(stored['sha256'])
+        except BaseException:
+            with self._lock:
+                self._added(shas)
+            raise
+        
+        with self._lock:
+            self._added(shas)
+            self._drop_entry(key)
+            self._db.execute(
+                'INSERT INTO entries (key, media, last_used) VALUES (?, ?, ?)',
+                (key, json.dumps(media), time.time())
+            )
+            self._db.executemany(
+                'INSERT OR IGNORE INTO refs (key, sha256) VALUES (?, ?)',
+                [(key, sha256) for sha256 in shas]
+            )
+            self._db.commit()
+            self._evict(keep=key)
+    
+    def _drop_entry(self, key: str):
+        self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self._db.execute('DELETE FROM refs WHERE key = ?', (key,))
+    
+    def _evict(self, keep: str):
+        """Drop least recently used entries until the files fit the budget"""
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+        if total <= self.budget:
+            return
+        keys = [row[0] for row in self._db.execute('SELECT key FROM entries ORDER BY last_used')]
+        for key in keys:
+            if total <= self.budget:
+                break
+            if key == keep or self._in_use[key]:
+                continue  # just added, or being sent right now
+            self._drop_entry(key)
+            orphans = self._db.execute(
+                'SELECT sha256, ext, size FROM objects WHERE sha256 NOT IN (SELECT sha256 FROM refs)'
+            ).fetchall()
+            for sha256, ext, size in orphans:
+                if sha256 in self._adding:
+                    continue  # another put() is about to reference it
+                try:
+                    self._object_path(sha256, ext).unlink()
+                except FileNotFoundError:
+                    pass
+                self._db.execute('DELETE FROM objects WHERE sha256 = ?', (sha256,))
+                total -= size
+        self._db.commit()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            files, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects').fetchone()
+        return {'entries': entries, 'files': files, 'bytes': size, 'budget': self.budget}
+    
+    async def get(self, key: str) -> Optional[Dict]:
+        """Stored media (same shape as UnifiedExtractor.process); release() it once sent"""
+        return await asyncio.to_thread(self._get, key)
+    
+    def release(self, key: str):
+        with self._lock:
+            self._in_use[key] -= 1
+            if self._in_use[key] <= 0:
+                del self._in_use[key]
+    
+    async def put(self, key: str, media: Dict):
+        """Keep a copy of processed media (files stay where they are)"""
+        try:
+            await asyncio.to_thread(self._put, key, media)
+        except Exception as e:
+            logger.warning(f"Media store: could not keep {key}: {e}")
+    
+    async def close(self):
+        await asyncio.to_thread(self._db.close)
+
+def create_media_store() -> Optional[MediaStore]:
+    """Build the store, or None when MEDIA_STORE_BUDGET_MB is 0"""
+    if config.MEDIA_STORE_BUDGET_MB <= 0:
+        return None
+    return MediaStore(config.CACHE_DIR / 'media', config.MEDIA_STORE_BUDGET_MB * 1024 * 1024)
@@ -0,0 +1,93 @@
+import re
+from typing import List, NamedTuple, Optional
+
+import config
+
+# Any link to a supported domain; the path is classified separately
+_LINK_RE = re.compile(
+    r'(?<![\w@.-])(?:https?://)?(?:[\w-]+\.)*(?:%s)(?![\w.-])(/[^\s<>"\']*)?' % '|'.join(
+        re.escape(domain) for domain in config.SUPPORTED_DOMAINS
+    ),
+    re.IGNORECASE
+)
+# /p/<code>, /reel/<code>, /reels/<code>, /tv/<code> (optionally after a username);
+# section names match in any case, shortcodes are case-sensitive. /reels/audio/<id> is a sound page
+_POST_RE = re.compile(r'/(?:[\w.]+/)?((?i:p|reels?|tv))/(?!(?i:audio)/)([\w-]+)')
+_STORY_RE = re.compile(r'/(?i:stories)/([\w.]+)/(\d+)')
+_SHARE_RE = re.compile(r'/(?i:share)/(?:((?i:p|reels?))/)?([\w-]+)')
+_PROFILE_RE = re.compile(r'/([A-Za-z0-9._]{1,30})/?(?:[?#]|$)')
+_USERNAME_RE = re.compile(r'^(?:https?://)?(?:www\.)?(?:instagram\.com/)?@?([A-Za-z0-9._]{1,30})/?(?:\?.*)?$')
+
+# First path segments that are Instagram pages, not accounts
+_RESERVED = frozenset({
+    'about', 'accounts', 'api', 'challenge', 'developer', 'direct', 'explore', 'legal',
+    'p', 'privacy', 'reel', 'reels', 'share', 'stories', 'terms', 'tv', 'web'
+})
+
+CANONICAL = 'https://www.instagram.com'
+
+class InstagramLink(NamedTuple):
+    """A recognised link, normalised before any network work"""
+    kind: str  # 'post', 'reel', 'story', 'profile' or 'share'
+    url: str  # canonical URL, without tracking parameters
+    key: Optional[str]  # shortcode or 'story:<id>'; None when only the network can tell
+
+def classify(url: str) -> Optional[InstagramLink]:
+    """Kind and canonical form of one Instagram URL, or None if it isn't one"""
+    match = _LINK_RE.match(url.strip())
+    return _classify_path(match.group(1) or '/') if match else None
+
+def _classify_path(path: str) -> Optional[InstagramLink]:
+    path = path.rstrip('.,;:!?)]}')  # sentence punctuation after a pasted link
+    match = _SHARE_RE.match(path)
+    if match:
+        # Opaque share token; Instagram redirects it to the real post
+        section, token = match.groups()
+        prefix = f'{section.lower()}/' if section else ''
+        return InstagramLink('share', f'{CANONICAL}/share/{prefix}{token}/', None)
+    match = _POST_RE.match(path)
+    if match:
+        section, shortcode = match.groups()
+        section = section.lower()
+        if section == 'p':
+            return InstagramLink('post', f'{CANONICAL}/p/{shortcode}/', shortcode)
+        section = 'tv' if section == 'tv' else 'reel'
+        return InstagramLink('reel', f'{CANONICAL}/{section}/{shortcode}/', shortcode)
+    match = _STORY_RE.match(path)
+    if match:
+        username, story_id = match.groups()
+        return InstagramLink('story', f'{CANONICAL}/stories/{username}/{story_id}/', f'story:{story_id}')
+    match = _PROFILE_RE.match(path)
+    if match and match.group(1).lower() not in _RESERVED:
+        return InstagramLink('profile', f'{CANONICAL}/{match.group(1).lower()}/', None)
+    return None
+
+def find_links(text: str, limit: int = 0) -> List[InstagramLink]:
+    """Every distinct Instagram link in a chat message, in order (at most limit if set)"""
+    if 'instagr' not in text.lower():
+        return []  # cheap exit for ordinary chat
+    links: List[InstagramLink] = []
+    for match in _LINK_RE.finditer(text):
+        link = _classify_path(match.group(1) or '/')
+        if link and link.url not in (known.url for known in links):
+            links.append(link)
+            if len(links) == limit:
+                break
+    return links
+
+def shortcode_from_url(url: str) -> Optional[str]:
+    """Return a stable cache key for an Instagram URL, or None if unknown"""
+    link = classify(url)
+    return link.key if link else None
+
+def username_from_text(text: str) -> Optional[str]:
+    """Account name from '@name', 'name' or a profile URL, or None"""
+    match = _USERNAME_RE.match(text.strip())
+    return match.group(1).lower() if match else None
+
+def content_kind(url: str) -> str:
+    """Rough content type of an Instagram URL: 'reel', 'post', 'story' or 'other'"""
+    link = classify(url)
+    if link and link.kind in ('post', 'reel', 'story'):
+        return link.kind
+    return 'other'
@@ -1,15 +1,38 @@
 ﻿import asyncio
-import psutil
+import json
+import os
+import sys
 import time
+import urllib.request
+from collections import deque
 from datetime import datetime
-import os
+from pathlib import Path
+
+import psutil
+from rich.console import Group
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+from rich.text import Text
+
+# Add project to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+
+LOG_FILE = str(config.LOGS_DIR / 'bot.log')
 
-# Simple console dashboard for Windows
+# Live console dashboard fed by the bot's /stats endpoint
 class TerminalDashboard:
     """Terminal dashboard for monitoring"""
     
-    def __init__(self):
+    def __init__(self, stats_url: str = None, log_file: str = LOG_FILE):
         self.start_time = time.time()
+        self.stats_url = stats_url or f'http://{config.METRICS_HOST}:{config.METRICS_PORT}/stats'
+        self.log_file = log_file
+        self.log_offset = 0
+        self.log_lines = deque(maxlen=5)
+        self.connected = False
         self.stats = {
             'downloads': 0,
             'users': 0,
@@ -19,57 +42,86 @@ class TerminalDashboard:
         
     async def start(self):
         """Start live dashboard"""
-        while True:
-            self.clear_screen()
-            self.render_header()
-            self.render_stats()
-            self.render_logs()
-            self.render_footer()
-            await asyncio.sleep(1)
+        with Live(self.render(), refresh_per_second=4, screen=False) as live:
+            while True:
+                await asyncio.to_thread(self.refresh)
+                live.update(self.render())
+                await asyncio.sleep(1)
     
-    def clear_screen(self):
-        """Clear console screen"""
-        os.system('cls' if os.name == 'nt' else 'clear')
+    def refresh(self):
+        """Pull live counters from the bot and new log lines"""
+        try:
+            with urllib.request.urlopen(self.stats_url, timeout=0.5) as resp:
+                self.stats = json.load(resp)
+            self.connected = True
+        except Exception:
+            self.connected = False
+        self.tail_logs()
     
-    def render_header(self):
+    def tail_logs(self):
+        """Read only what was appended since the last tick"""
+        try:
+            size = os.path.getsize(self.log_file)
+        except OSError:
+            return
+        if size < self.log_offset:
+            # Log was truncated or rotated
+            self.log_offset = 0
+        if size == self.log_offset:
+            return
+        
+        with open(self.log_file, 'rb') as f:
+            if self.log_offset == 0 and size > 64 * 1024:
+                # First read of a big log - only the tail matters
+                self.log_offset = size - 64 * 1024
+            f.seek(self.log_offset)
+            chunk = f.read(size - self.log_offset)
+        
+        # Keep a trailing partial line for the next tick
+        end = chunk.rfind(b'\n') + 1
+        self.log_offset += end
+        for line in chunk[:end].decode('utf-8', errors='replace').splitlines():
+            self.log_lines.append(line)
+    
+    def render(self) -> Group:
+        return Group(self.render_header(), self.render_stats(), self.render_logs(), self.render_footer())
+    
+    def render_header(self) -> Panel:
         """Render header"""
-        print("="*60)
-        print("🤖 INSTAGRAM ULTIMATE BOT DASHBOARD")
-        print(f"Uptime: {self.get_uptime()}")
-        print("="*60)
+        status = '[green]connected[/green]' if self.connected else '[red]bot not reachable[/red]'
+        return Panel(
+            f"Uptime: {self.get_uptime()}  |  {status}",
+            title="🤖 INSTAGRAM ULTIMATE BOT DASHBOARD"
+        )
     
-    def render_stats(self):
+    def render_stats(self) -> Table:
         """Render statistics"""
-        print("\n📊 STATISTICS:")
-        print(f"  Downloads: {self.stats['downloads']}")
-        print(f"  Active Users: {self.stats['users']}")
-        print(f"  Errors: {self.stats['errors']}")
-        print(f"  Data Sent: {self.format_bytes(self.stats['bytes_sent'])}")
+        table = Table(title="📊 STATISTICS", show_header=False, expand=True)
+        table.add_column("Metric")
+        table.add_column("Value", justify="right")
+        table.add_row("Downloads", str(self.stats.get('downloads', 0)))
+        table.add_row("Active Users", str(self.stats.get('users', 0)))
+        table.add_row("Errors", str(self.stats.get('errors', 0)))
+        table.add_row("Data Sent", self.format_bytes(self.stats.get('bytes_sent', 0)))
+        if 'cache_hits' in self.stats:
+            table.add_row("Cache hits / misses", f"{self.stats['cache_hits']} / {self.stats['cache_misses']}")
+        scheduler = self.stats.get('scheduler')
+        if scheduler:
+            table.add_row("Queue / Running", f"{scheduler['queued']} / {scheduler['running']}")
         
         # System stats
-        print(f"  CPU Usage: {psutil.cpu_percent()}%")
-        print(f"  Memory: {psutil.virtual_memory().percent}%")
+        table.add_row("CPU Usage", f"{psutil.cpu_percent()}%")
+        table.add_row("Memory", f"{psutil.virtual_memory().percent}%")
+        return table
     
-    def render_logs(self):
+    def render_logs(self) -> Panel:
         """Render recent logs"""
-        print("\n📝 RECENT LOGS:")
-        print("-"*60)
-        try:
-            if os.path.exists('logs/bot.log'):
-                with open('logs/bot.log', 'r') as f:
-                    lines = f.readlines()[-5:]  # Last 5 lines
-                    for line in lines:
-                        print(line.strip())
-            else:
-                print("No logs available")
-        except:
-            print("Error reading logs")
+        body = '\n'.join(self.log_lines) if self.log_lines else "No logs available"
+        return Panel(Text(body, overflow='ellipsis', no_wrap=True), title="📝 RECENT LOGS")
     
-    def render_footer(self):
+    def render_footer(self) -> Text:
         """Render footer"""
-        print("-"*60)
-        print("Press Ctrl+C to exit | Active Node: mesh-001")
-        print("="*60)
+        return Text(f"Press Ctrl+C to exit | Active Node: {config.NODE_ID or 'local'} | {datetime.now():%H:%M:%S}")
     
     def get_uptime(self):
         """Get formatted uptime"""
@@ -89,6 +141,8 @@ class TerminalDashboard:
         return f"{bytes_num:.1f} TB"
 
 if __name__ == "__main__":
-    import asyncio
     dashboard = TerminalDashboard()
-    asyncio.run(dashboard.start())
+    try:
+        asyncio.run(dashboard.start())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from core.scheduler import FairScheduler, SchedulerBusy
+
+def make_scheduler(workers=1, max_queue=100, user_max_inflight=1, user_max_queued=10):
+    return FairScheduler(workers, max_queue, user_max_inflight, user_max_queued)
+
+def recorder(order, label, result=None):
+    async def func():
+        order.append(label)
+        return result
+    return func
+
+@pytest.mark.asyncio
+async def test_jobs_run_round_robin_across_users():
+    scheduler = make_scheduler()
+    order = []
+    jobs = [scheduler.submit(1, recorder(order, f'a{i}')) for i in range(3)]
+    jobs += [scheduler.submit(2, recorder(order, f'b{i}')) for i in range(2)]
+    
+    await asyncio.gather(*jobs)
+    
+    assert order == ['a0', 'b0', 'a1', 'b1', 'a2']
+    await scheduler.close()
+
+@pytest.mark.asyncio
+async def test_submit_refuses_beyond_queue_limits():
+    scheduler = make_scheduler(max_queue=3, user_max_queued=2)
+    order = []
+    scheduler.submit(1, recorder(order, 'a0'))
+    scheduler.submit(1, recorder(order, 'a1'))
+    
+    with pytest.raises(SchedulerBusy) as busy:
+        scheduler.submit(1, recorder(order, 'a2'))
+    assert busy.value.depth == 2
+    
+    scheduler.submit(2, recorder(order, 'b0'))
+    with pytest.raises(SchedulerBusy) as busy:
+        scheduler.submit(3, recorder(order, 'c0'))
+    assert busy.value.depth == 3
+    assert scheduler.stats()['rejected'] == 2
+    await scheduler.close()
+
+@pytest.mark.asyncio
+async def test_cancelled_job_is_withdrawn_from_the_queue():
+    scheduler = make_scheduler()
+    release = asyncio.Event()
+    order = []
+    
+    async def blocker():
+        await release.wait()
+        return 'first'
+    
+    first = scheduler.submit(1, blocker)
+    second = scheduler.submit(2, recorder(order, 'b0'))
+    await asyncio.sleep(0)
+    second.future.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.stats()['queued'] == 0
+    
+    release.set()
+    assert await first == 'first'
+    assert order == []
+    await scheduler.close()
+
+class Abort(BaseException):
+    pass
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('error', [asyncio.CancelledError, Abort])
+async def test_worker_survives_job_raising_base_exception(error):
+    scheduler = make_scheduler(workers=1)
+    
+    async def failing():
+        raise error()
+    
+    failed = scheduler.submit(1, failing)
+    with pytest.raises(error):
+        await asyncio.wait_for(failed.future, timeout=1)
+    
+    order = []
+    later = scheduler.submit(2, recorder(order, 'b0', 'done'))
+    assert await asyncio.wait_for(later.future, timeout=1) == 'done'
+    assert scheduler.stats() == {'queued': 0, 'running': 0, 'users_waiting': 0, 'rejected': 0}
+    await scheduler.close()
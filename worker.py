@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Instagram Ultimate Bot - Download Worker
+
+Pulls download jobs from the shared job queue, runs UnifiedExtractor and
+reports results back to the front end (BOT_ROLE=frontend) for delivery.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import uuid
+from pathlib import Path
+
+# Add project to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.extractors.unified import UnifiedExtractor
+from core.extractors.workers import remove_workspace
+from core.jobqueue import JOBS_QUEUE, create_job_queue
+import config
+
+logger = logging.getLogger('worker')
+
+class DownloadWorker:
+    """Runs queued extraction jobs in one process"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.queue = create_job_queue()
+        self.extractor = UnifiedExtractor()
+    
+    async def run(self):
+        logger.info(f"Worker {self.name} started ({config.WORKER_CONCURRENCY} slots)")
+        prewarm = asyncio.ensure_future(self.extractor.prewarm())
+        try:
+            await asyncio.gather(*(self._slot() for _ in range(config.WORKER_CONCURRENCY)))
+        finally:
+            prewarm.cancel()
+            await self.extractor.close()
+            await self.queue.close()
+    
+    async def _slot(self):
+        idle = config.JOB_POLL_INTERVAL
+        while True:
+            try:
+                message = await self.queue.get(JOBS_QUEUE, self.name, config.JOB_VISIBILITY_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Job queue error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                # Back off while idle so empty polls don't keep taking the queue's write lock
+                await asyncio.sleep(idle)
+                idle = min(idle * 2, config.JOB_POLL_MAX_INTERVAL)
+                continue
+            idle = config.JOB_POLL_INTERVAL
+            try:
+                await self._handle(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Not acked: the lease runs out and the job is delivered again
+                logger.error(f"Job {message['id']} failed: {e}")
+                await asyncio.sleep(1)
+    
+    async def _heartbeat(self, job_id: str):
+        """Keep the lease alive while the job is running"""
+        while True:
+            await asyncio.sleep(config.JOB_VISIBILITY_TIMEOUT / 3)
+            try:
+                await self.queue.touch(JOBS_QUEUE, job_id, config.JOB_VISIBILITY_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Could not extend lease of job {job_id}: {e}")
+    
+    async def _handle(self, message):
+        payload = message['payload']
+        url = payload['url']
+        
+        if message['attempts'] > config.JOB_MAX_ATTEMPTS:
+            logger.warning(f"Giving up on {url} after {message['attempts'] - 1} attempts")
+            result = {'success': False, 'error': 'Download kept failing on the workers'}
+        else:
+            logger.info(f"Job {message['id']}: {url}")
+            heartbeat = asyncio.ensure_future(self._heartbeat(message['id']))
+            try:
+                # The front end takes over the workspace and removes it after delivery
+                result = await self.extractor.extract_once(url)
+            finally:
+                heartbeat.cancel()
+        
+        try:
+            await self.queue.put(payload['reply_to'], uuid.uuid4().hex, {
+                'job_id': message['id'],
+                'node': self.name,
+                'result': result
+            })
+        except BaseException:
+            # Nobody will take over this download; the retry fetches it again
+            if result.get('success'):
+                remove_workspace(result['data']['workspace'])
+            raise
+        await self.queue.ack(JOBS_QUEUE, message['id'])
+
+def run_worker(index: int):
+    """Entry point of one worker process"""
+    config.ensure_dirs()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)s | %(name)s | %(message)s'
+    )
+    name = f"{config.NODE_ID or socket.gethostname()}-{index}-{os.getpid()}"
+    try:
+        asyncio.run(DownloadWorker(name).run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run download workers")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help="worker processes to start (default: CPU count)")
+    args = parser.parse_args()
+    
+    if config.BOT_ROLE != 'frontend':
+        # A standalone bot downloads in-process and never enqueues anything
+        sys.exit("Workers only serve a front end: set BOT_ROLE=frontend for the bot and the workers")
+    
+    if args.processes == 1:
+        run_worker(0)
+    else:
+        processes = [multiprocessing.Process(target=run_worker, args=(i,)) for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()